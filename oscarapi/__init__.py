@@ -0,0 +1 @@
+default_app_config = 'oscarapi.config.OscarApiConfig'
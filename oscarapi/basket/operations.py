@@ -3,11 +3,30 @@ from django.conf import settings
 from oscar.core.loading import get_class, get_model
 from oscar.core.utils import get_default_currency
 
+from oscarapi.cache import (
+    bump_generation,
+    bump_version,
+    get_generation,
+    get_shared_cache,
+    get_version,
+    hashed_cache_key
+)
+from oscarapi.utils import get_strategy, overridable
+
 __all__ = (
     'apply_offers',
+    'apply_offers_if_needed',
+    'invalidate_offer_cache',
+    'voucher_gives_discount',
+    'get_shipping_quotes',
+    'invalidate_shipping_cache',
     'assign_basket_strategy',
+    'assign_baskets_strategy',
     'prepare_basket',
     'get_basket',
+    'get_request_basket',
+    'set_request_basket',
+    'clear_request_basket',
     'get_basket_id_from_session',
     'get_anonymous_basket',
     'get_user_basket',
@@ -20,51 +39,305 @@ __all__ = (
 
 Basket = get_model('basket', 'Basket')
 Applicator = get_class('offer.applicator', 'Applicator')
-Selector = None
+OfferApplications = get_class('offer.results', 'OfferApplications')
+Repository = get_class('shipping.repository', 'Repository')
+
+OFFER_CACHE_PREFIX = 'oscarapi.offers'
+SHIPPING_CACHE_PREFIX = 'oscarapi.shipping'
 
 
 def apply_offers(request, basket):
     "Apply offers and discounts to cart"
     basket.reset_offer_applications()
     if not basket.is_empty:
-        Applicator().apply(basket, request.user, request)
+        timeout = overridable('OSCARAPI_OFFER_CACHE_TIMEOUT', 0)
+        if timeout:
+            _apply_cached_offers(request, basket, timeout)
+        else:
+            _get_applicator(request).apply(basket, request.user, request)
+    basket._oscarapi_offers_applied = True
+
+
+def _get_applicator(request):
+    """
+    Return the applicator of this request.
+
+    The site offers are the same for every basket, so the applicator only
+    looks them up once per request, which matters when offers are applied
+    to many baskets, like in the basket list.
+    """
+    holder = _basket_holder(request)
+    applicator = getattr(holder, '_oscarapi_applicator', None)
+    if applicator is None:
+        applicator = Applicator()
+        get_site_offers = applicator.get_site_offers
+        site_offers = []
+
+        def get_shared_site_offers():
+            if not site_offers:
+                site_offers.append(list(get_site_offers()))
+            return site_offers[0]
+
+        applicator.get_site_offers = get_shared_site_offers
+        holder._oscarapi_applicator = applicator
+
+    return applicator
+
+
+def _basket_fingerprint(request, basket):
+    """
+    Fingerprint everything that determines which discounts the offers give:
+    the lines with their prices, the vouchers, the user and the generation
+    of the offers, which is bumped when offers or vouchers change.
+    """
+    user = request.user
+    fingerprint = [
+        get_generation(OFFER_CACHE_PREFIX),
+        user.pk if user.is_authenticated() else None,
+        sorted(voucher.pk for voucher in basket.vouchers.all()),
+    ]
+    for line in basket.all_lines():
+        price = line.purchase_info.price
+        fingerprint.append((
+            line.pk, line.product_id, line.stockrecord_id, line.quantity,
+            price.excl_tax, price.incl_tax if price.is_tax_known else None
+        ))
+    return fingerprint
+
+
+def _offer_cache_key(request, basket):
+    return hashed_cache_key(
+        OFFER_CACHE_PREFIX, repr(_basket_fingerprint(request, basket)))
+
+
+def _apply_cached_offers(request, basket, timeout):
+    """
+    Apply offers to the basket, reusing the discounts from the cache when the
+    same basket content was seen before.
+    """
+    cache = get_shared_cache()
+    cache_key = _offer_cache_key(request, basket)
+    cached = cache.get(cache_key)
+    if cached is None:
+        _get_applicator(request).apply(basket, request.user, request)
+        line_discounts = dict(
+            (line.pk, (line._discount_excl_tax, line._discount_incl_tax,
+                       line._affected_quantity))
+            for line in basket.all_lines()
+        )
+        cache.set(
+            cache_key,
+            (basket.offer_applications.applications, line_discounts),
+            timeout)
+    else:
+        applications, line_discounts = cached
+        basket.offer_applications = OfferApplications()
+        basket.offer_applications.applications = applications
+        for line in basket.all_lines():
+            if line.pk in line_discounts:
+                (line._discount_excl_tax, line._discount_incl_tax,
+                 line._affected_quantity) = line_discounts[line.pk]
+
+
+def invalidate_offer_cache():
+    "Forget the cached discounts of all baskets."
+    bump_generation(OFFER_CACHE_PREFIX)
+
+
+def voucher_gives_discount(request, basket, voucher):
+    """
+    Check if the voucher would give a discount on the basket, without adding
+    it to the basket.
+
+    The offers, including the ones of the voucher, are applied to the basket
+    in memory. When the voucher gives a discount the basket keeps those
+    discounts, so it looks as if the voucher was added, otherwise the offers
+    are applied again the next time they are needed.
+    """
+    basket.reset_offer_applications()
+    if basket.is_empty:
+        basket._oscarapi_offers_applied = False
+        return False
+
+    applicator = _get_applicator(request)
+    offers = applicator.get_offers(basket, request.user, request)
+    if not any(offer.get_voucher() == voucher for offer in offers):
+        voucher_offers = list(voucher.offers.all())
+        for offer in voucher_offers:
+            offer.set_voucher(voucher)
+        offers = sorted(offers + voucher_offers,
+                        key=lambda offer: offer.priority, reverse=True)
+    applicator.apply_offers(basket, offers)
+
+    for discount in basket.offer_applications:
+        if discount['voucher'] and discount['voucher'] == voucher:
+            basket._oscarapi_offers_applied = True
+            return True
 
+    basket.reset_offer_applications()
+    basket._oscarapi_offers_applied = False
+    return False
 
-def assign_basket_strategy(basket, request):
-    # fixes too early import of Selector
-    # TODO: check if this is still true, now the basket models nolonger
-    #       require this module to be loaded.
-    global Selector
 
-    if hasattr(request, 'strategy'):
-        basket.strategy = request.strategy
-    else:  # in management commands, the request might not be available.
-        if Selector is None:
-            Selector = get_class('partner.strategy', 'Selector')
-        basket.strategy = Selector().strategy(
-            request=request, user=request.user)
+def get_shipping_quotes(request, basket, shipping_address=None):
+    """
+    Return the shipping methods available for the basket, with their charges,
+    as a list of ``(method, charge)`` tuples.
+
+    The quotes are remembered for the rest of the request, and kept in the
+    ``OSCARAPI_CACHE`` cache for ``OSCARAPI_SHIPPING_CACHE_TIMEOUT`` seconds,
+    for the same basket content, user and shipping country and postcode,
+    until the shipping methods change.
+    """
+    apply_offers_if_needed(request, basket)
+
+    shipping_address = shipping_address or {}
+    country = shipping_address.get('country')
+    cache_key = hashed_cache_key(SHIPPING_CACHE_PREFIX, repr((
+        get_version(SHIPPING_CACHE_PREFIX)[0],
+        _basket_fingerprint(request, basket),
+        getattr(country, 'pk', country),
+        shipping_address.get('postcode'),
+    )))
+
+    holder = _basket_holder(request)
+    if not hasattr(holder, '_oscarapi_shipping_quotes'):
+        holder._oscarapi_shipping_quotes = {}
+    quotes = holder._oscarapi_shipping_quotes.get(cache_key)
+    if quotes is not None:
+        return quotes
+
+    timeout = overridable('OSCARAPI_SHIPPING_CACHE_TIMEOUT', 0)
+    if timeout:
+        quotes = get_shared_cache().get(cache_key)
+
+    if quotes is None:
+        methods = Repository().get_shipping_methods(
+            basket=basket, user=request.user, request=request,
+            shipping_addr=shipping_address or None)
+        quotes = [(method, method.calculate(basket)) for method in methods]
+        if timeout:
+            get_shared_cache().set(cache_key, quotes, timeout)
+
+    holder._oscarapi_shipping_quotes[cache_key] = quotes
+    return quotes
+
+
+def invalidate_shipping_cache():
+    "Forget the cached shipping methods of all baskets."
+    bump_version(SHIPPING_CACHE_PREFIX)
+
+
+def apply_offers_if_needed(request, basket):
+    """
+    Apply offers to a basket, unless they were already applied since the
+    strategy was assigned. Call this before reading prices or discounts.
+    """
+    if not basket.has_strategy:
+        assign_basket_strategy(basket, request)
+    if not getattr(basket, '_oscarapi_offers_applied', False):
+        apply_offers(request, basket)
+    return basket
+
+
+def assign_basket_strategy(basket, request):
+    """
+    Assign the strategy of the request to the basket.
 
-    apply_offers(request, basket)
+    Offers are applied lazily by ``apply_offers_if_needed``, because that is
+    expensive and lots of code only needs the basket itself.
+    """
+    basket.strategy = get_strategy(request)
+    basket._oscarapi_offers_applied = False
 
     return basket
 
 
+def assign_baskets_strategy(baskets, request):
+    """
+    Assign one strategy to many baskets, use this instead of
+    ``assign_basket_strategy`` when preparing a list of baskets.
+    """
+    strategy = get_strategy(request)
+    for basket in baskets:
+        basket.strategy = strategy
+        basket._oscarapi_offers_applied = False
+
+    return baskets
+
+
 def prepare_basket(basket, request):
+    """
+    Assign the strategy of the request to the basket and store it in the
+    session. Offers are not applied, call ``apply_offers_if_needed`` before
+    reading prices or discounts.
+    """
     assign_basket_strategy(basket, request)
     store_basket_in_session(basket, request.session)
     return basket
 
 
-def get_basket(request, prepare=True):
-    "Get basket from the request."
+def _basket_holder(request):
+    # rest framework wraps the django request, but the middleware only sees
+    # the django request, so keep the basket there.
+    return getattr(request, '_request', request)
+
+
+def get_request_basket(request):
+    """
+    Return the basket that was looked up earlier during this request, or
+    None if there is none or it no longer belongs to the request.
+    """
+    basket = getattr(_basket_holder(request), '_oscarapi_basket', None)
+    if basket is None or not basket.can_be_edited:
+        return None
+
     if request.user.is_authenticated():
-        basket = get_user_basket(request.user)
-    else:
-        basket = get_anonymous_basket(request)
-        if basket is None:
-            basket = Basket.objects.create()
-            basket.save()
-    return prepare_basket(basket, request) if prepare else basket
+        if basket.owner_id == request.user.pk:
+            return basket
+    elif basket.owner_id is None and \
+            get_basket_id_from_session(request) in (None, basket.pk):
+        return basket
+
+    return None
+
+
+def set_request_basket(request, basket, prepared=False):
+    "Remember ``basket`` as the basket of this request."
+    holder = _basket_holder(request)
+    holder._oscarapi_basket = basket
+    holder._oscarapi_basket_prepared = prepared
+
+
+def clear_request_basket(request):
+    """
+    Forget the basket of this request, call this when the basket was changed
+    through another basket or line instance.
+    """
+    set_request_basket(request, None)
+
+
+def get_basket(request, prepare=True):
+    """
+    Get basket from the request. Offers are not applied, call
+    ``apply_offers_if_needed`` before reading prices or discounts.
+    """
+    basket = get_request_basket(request)
+    if basket is None:
+        if request.user.is_authenticated():
+            basket = get_user_basket(request.user)
+        else:
+            basket = get_anonymous_basket(request)
+            if basket is None:
+                basket = Basket.objects.create()
+                basket.save()
+        set_request_basket(request, basket)
+
+    if prepare and not _basket_holder(request)._oscarapi_basket_prepared:
+        prepare_basket(basket, request)
+        set_request_basket(request, basket, prepared=True)
+
+    return basket
 
 
 def get_basket_id_from_session(request):
@@ -104,14 +377,17 @@ def get_user_basket(user):
 
 
 def store_basket_in_session(basket, session):
-    session[settings.OSCAR_BASKET_COOKIE_OPEN] = basket.pk
-    session.save()
+    # only write the session when the basket actually changed, most requests
+    # are made by shoppers that already have their basket in the session.
+    if session.get(settings.OSCAR_BASKET_COOKIE_OPEN) != basket.pk:
+        session[settings.OSCAR_BASKET_COOKIE_OPEN] = basket.pk
+        session.save()
 
 
 def request_contains_basket(request, basket):
     if basket.can_be_edited:
         if request.user.is_authenticated():
-            return request.user == basket.owner
+            return request.user.pk == basket.owner_id
 
         return get_basket_id_from_session(request) == basket.pk
 
@@ -0,0 +1,281 @@
+"Caches used by oscarapi to keep lookups off the database"
+import collections
+import hashlib
+import threading
+import time
+
+from django.core.cache import caches
+from django.utils.encoding import force_bytes
+
+from oscarapi.utils import overridable
+
+__all__ = (
+    'ExpiringLRUCache',
+    'get_shared_cache',
+    'hashed_cache_key',
+    'get_generation',
+    'bump_generation',
+    'get_version',
+    'bump_version',
+    'api_key_is_valid',
+    'invalidate_api_keys',
+    'get_catalogue_version',
+    'invalidate_catalogue',
+    'invalidate_stockrecords',
+    'get_voucher_by_code',
+    'invalidate_vouchers',
+)
+
+_MISSING = object()
+
+
+class ExpiringLRUCache(object):
+    """
+    A process local, thread safe cache which evicts the least recently used
+    entries when it grows beyond ``max_size`` and which forgets entries after
+    their timeout has passed.
+
+    >>> cache = ExpiringLRUCache(max_size=2)
+    >>> cache.set('a', 1, 60)
+    >>> cache.set('b', 2, 60)
+    >>> cache.get('a')
+    1
+    >>> cache.set('c', 3, 60)
+    >>> cache.get('b') is None
+    True
+    >>> cache.set('d', 4, -1)
+    >>> cache.get('d') is None
+    True
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value, expires = self._data.pop(key, (_MISSING, None))
+            if value is _MISSING or expires < time.time():
+                return default
+
+            # re-insert to mark the entry as most recently used.
+            self._data[key] = (value, expires)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time() + timeout)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def get_shared_cache():
+    "Return the django cache configured with ``OSCARAPI_CACHE``."
+    return caches[overridable('OSCARAPI_CACHE', 'default')]
+
+
+def hashed_cache_key(prefix, value):
+    """
+    Make a cache key which is safe to use with any cache backend, and which
+    doesn't leak secrets like api keys or voucher codes into the cache.
+
+    >>> hashed_cache_key('oscarapi.test', 'koe')
+    'oscarapi.test.80e47b3ea3632998b52b1660ebe6c570232f882c'
+    """
+    return '%s.%s' % (prefix, hashlib.sha1(force_bytes(value)).hexdigest())
+
+
+def get_generation(name):
+    """
+    Return the generation of a group of cache entries. Put it in the cache
+    keys of the group, so ``bump_generation`` makes all of them stale.
+    """
+    return get_shared_cache().get('%s.generation' % name, 0)
+
+
+def bump_generation(name):
+    "Make all cache entries of the ``name`` group stale."
+    shared_cache = get_shared_cache()
+    generation_key = '%s.generation' % name
+    if not shared_cache.add(generation_key, 1, None):
+        try:
+            shared_cache.incr(generation_key)
+        except ValueError:  # evicted since the add
+            shared_cache.set(generation_key, 1, None)
+
+
+API_KEY_CACHE_PREFIX = 'oscarapi.apikey'
+
+api_key_cache = ExpiringLRUCache(
+    max_size=overridable('OSCARAPI_APIKEY_CACHE_SIZE', 1024))
+
+
+def api_key_is_valid(key):
+    """
+    Check if ``key`` is a known ``ApiKey``.
+
+    Both valid and invalid keys are cached, so neither legitimate traffic nor
+    key guessing will hit the database for every request. The local cache
+    can be backed by the shared django cache by enabling
+    ``OSCARAPI_APIKEY_SHARED_CACHE``, which also makes keys changed by other
+    processes stale in the local cache.
+    """
+    from oscarapi.models import ApiKey
+
+    cache_key = hashed_cache_key(API_KEY_CACHE_PREFIX, key)
+    shared_cache = shared_cache_key = generation = None
+    if overridable('OSCARAPI_APIKEY_SHARED_CACHE', False):
+        # keys are changed in other processes as well, so the local entries
+        # are only valid for the current generation of the shared cache.
+        shared_cache = get_shared_cache()
+        generation = get_generation(API_KEY_CACHE_PREFIX)
+        shared_cache_key = '%s.%s' % (cache_key, generation)
+
+    cached = api_key_cache.get(cache_key)
+    if cached is not None:
+        is_valid, cached_generation = cached
+        if cached_generation == generation:
+            return is_valid
+
+    is_valid = None
+    if shared_cache is not None:
+        is_valid = shared_cache.get(shared_cache_key)
+
+    if is_valid is None:
+        is_valid = ApiKey.objects.filter(key=key).exists()
+
+    if is_valid:
+        # without the shared cache, other processes do not hear about revoked
+        # keys, so only remember valid keys shortly.
+        default_timeout = 10 if shared_cache is None else 300
+        timeout = overridable('OSCARAPI_APIKEY_CACHE_TIMEOUT', default_timeout)
+    else:
+        timeout = overridable('OSCARAPI_APIKEY_NEGATIVE_CACHE_TIMEOUT', 60)
+
+    if timeout:
+        api_key_cache.set(cache_key, (is_valid, generation), timeout)
+        if shared_cache is not None:
+            shared_cache.set(shared_cache_key, is_valid, timeout)
+
+    return is_valid
+
+
+def invalidate_api_keys():
+    """
+    Forget all cached api key lookups.
+
+    A changed key could have been renamed, so there is no telling which
+    cached lookups are stale, but api keys change rarely enough to just drop
+    them all.
+    """
+    api_key_cache.clear()
+    if overridable('OSCARAPI_APIKEY_SHARED_CACHE', False):
+        bump_generation(API_KEY_CACHE_PREFIX)
+
+
+def get_version(name):
+    """
+    Return the generation of the ``name`` group and the time it last changed.
+
+    Unlike ``get_generation``, when the cache lost track of the group, it
+    starts a new generation based on the current time, so it can not be
+    mistaken for an older one.
+    """
+    shared_cache = get_shared_cache()
+    generation_key = '%s.generation' % name
+    modified_key = '%s.modified' % name
+
+    versions = shared_cache.get_many([generation_key, modified_key])
+    if len(versions) < 2:
+        now = time.time()
+        # the generation is only bumped by one at a time, so starting it at
+        # the current time in milliseconds keeps it ahead of older ones.
+        shared_cache.add(generation_key, int(now * 1000), None)
+        shared_cache.add(modified_key, int(now), None)
+        versions = shared_cache.get_many([generation_key, modified_key])
+        versions.setdefault(generation_key, int(now * 1000))
+        versions.setdefault(modified_key, int(now))
+
+    return versions[generation_key], versions[modified_key]
+
+
+def bump_version(name):
+    "Start a new version of the ``name`` group."
+    get_version(name)
+    bump_generation(name)
+    get_shared_cache().set('%s.modified' % name, int(time.time()), None)
+
+
+CATALOGUE_CACHE_PREFIX = 'oscarapi.catalogue'
+
+
+def get_catalogue_version():
+    "Return the generation of the catalogue and the time it last changed."
+    return get_version(CATALOGUE_CACHE_PREFIX)
+
+
+def invalidate_catalogue():
+    """
+    Mark the products, options, partners and countries as changed, which
+    makes the responses cached for them stale.
+    """
+    bump_version(CATALOGUE_CACHE_PREFIX)
+
+
+STOCKRECORD_CACHE_PREFIX = 'oscarapi.stockrecords'
+
+
+def invalidate_stockrecords():
+    "Make the responses cached for stockrecords stale."
+    bump_version(STOCKRECORD_CACHE_PREFIX)
+
+
+VOUCHER_CACHE_PREFIX = 'oscarapi.vouchers'
+
+
+def get_voucher_by_code(code):
+    """
+    Return the ``Voucher`` with ``code``, or None when there is none.
+
+    Both known and unknown codes are kept in the shared cache, so guessing
+    voucher codes does not hit the database for every attempt.
+    """
+    from oscar.core.loading import get_model
+    Voucher = get_model('voucher', 'Voucher')
+
+    shared_cache = get_shared_cache()
+    cache_key = '%s.%s' % (hashed_cache_key(VOUCHER_CACHE_PREFIX, code),
+                           get_generation(VOUCHER_CACHE_PREFIX))
+    # unknown codes are cached as False, because None means a cache miss.
+    voucher = shared_cache.get(cache_key)
+    if voucher is not None:
+        return voucher or None
+
+    try:
+        voucher = Voucher.objects.get(code=code)
+    except Voucher.DoesNotExist:
+        voucher = None
+
+    if voucher is not None:
+        timeout = overridable('OSCARAPI_VOUCHER_CACHE_TIMEOUT', 300)
+    else:
+        timeout = overridable('OSCARAPI_VOUCHER_NEGATIVE_CACHE_TIMEOUT', 60)
+
+    if timeout:
+        shared_cache.set(cache_key, voucher or False, timeout)
+
+    return voucher
+
+
+def invalidate_vouchers():
+    "Forget all cached voucher lookups."
+    bump_generation(VOUCHER_CACHE_PREFIX)
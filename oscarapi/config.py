@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.translation import ugettext_lazy as _
+
+
+class OscarApiConfig(AppConfig):
+    label = 'oscarapi'
+    name = 'oscarapi'
+    verbose_name = _('Oscar API')
+
+    def ready(self):
+        from . import receivers  # noqa
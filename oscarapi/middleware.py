@@ -4,7 +4,7 @@ import re
 from django.conf import settings
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.core.exceptions import PermissionDenied
-from django.core.urlresolvers import reverse
+from django.core.urlresolvers import get_script_prefix, get_urlconf, reverse
 from django.http.response import HttpResponse
 from django.utils.translation import ugettext as _
 
@@ -23,7 +23,7 @@ from oscarapi.utils import (
     session_id_from_parsed_session_uri,
     get_session
 )
-from oscarapi import models
+from oscarapi.cache import api_key_is_valid
 
 
 BasketMiddleware = get_class('basket.middleware', 'BasketMiddleware')
@@ -92,12 +92,43 @@ def start_or_resume(session_id, session_type):
     return get_session(session_id, raise_on_create=True)
 
 
+_api_roots = {}
+
+
+def get_api_root():
+    """
+    Return the lowercased url of the api root.
+
+    Reversing the url is relatively expensive, and the outcome only depends on
+    the urlconf and script prefix, so it is only done once for each of those.
+    """
+    key = (get_urlconf(), get_script_prefix())
+    try:
+        return _api_roots[key]
+    except KeyError:
+        api_root = _api_roots[key] = reverse('api-root').lower()
+        return api_root
+
+
+def clear_api_root_cache():
+    _api_roots.clear()
+
+
 class IsApiRequest(object):
     @staticmethod
     def is_api_request(request):
-        path = request.path.lower()
-        api_root = reverse('api-root').lower()
-        return path.startswith(api_root)
+        """
+        Check if the request is an api request.
+
+        All middlewares share the outcome, which is stored on the request.
+        """
+        try:
+            return request._oscarapi_is_api_request
+        except AttributeError:
+            path = request.path.lower()
+            is_api_request = path.startswith(get_api_root())
+            request._oscarapi_is_api_request = is_api_request
+            return is_api_request
 
 
 class HeaderSessionMiddleware(SessionMiddleware, IsApiRequest):
@@ -169,11 +200,13 @@ class HeaderSessionMiddleware(SessionMiddleware, IsApiRequest):
 class ApiGatewayMiddleWare(IsApiRequest):
     """
     Protect the api gateway with a token.
+
+    Lookups of the token are cached, see ``OSCARAPI_APIKEY_CACHE_TIMEOUT``.
     """
     def process_request(self, request):
         if self.is_api_request(request):
             key = authentication.get_authorization_header(request)
-            if models.ApiKey.objects.filter(key=key).exists():
+            if api_key_is_valid(key):
                 return None
 
             logger.error('Invalid credentials provided for %s:%s by %s' % (
@@ -0,0 +1,17 @@
+"Pagination for large lists, like the products of a big catalogue"
+from rest_framework import pagination
+
+from oscarapi.utils import overridable
+
+__all__ = ('CursorPagination',)
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Paginates by primary key, so getting a page neither scans the skipped
+    rows with an OFFSET nor counts all rows.
+    """
+    ordering = 'pk'
+
+    def __init__(self):
+        self.page_size = overridable('OSCARAPI_CURSOR_PAGE_SIZE', None)
@@ -0,0 +1,161 @@
+from django.core.signals import setting_changed
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save
+)
+from django.dispatch import receiver
+from oscar.core.loading import get_model
+
+from oscarapi.basket.operations import (
+    invalidate_offer_cache,
+    invalidate_shipping_cache
+)
+from oscarapi.cache import (
+    invalidate_api_keys,
+    invalidate_catalogue,
+    invalidate_stockrecords,
+    invalidate_vouchers
+)
+from oscarapi.middleware import clear_api_root_cache
+from oscarapi.models import ApiKey
+from oscarapi.utils import clear_url_templates
+
+AttributeOption = get_model('catalogue', 'AttributeOption')
+Benefit = get_model('offer', 'Benefit')
+Category = get_model('catalogue', 'Category')
+Condition = get_model('offer', 'Condition')
+ConditionalOffer = get_model('offer', 'ConditionalOffer')
+Country = get_model('address', 'Country')
+Option = get_model('catalogue', 'Option')
+OrderAndItemCharges = get_model('shipping', 'OrderAndItemCharges')
+Partner = get_model('partner', 'Partner')
+Product = get_model('catalogue', 'Product')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+ProductCategory = get_model('catalogue', 'ProductCategory')
+ProductClass = get_model('catalogue', 'ProductClass')
+ProductImage = get_model('catalogue', 'ProductImage')
+ProductRecommendation = get_model('catalogue', 'ProductRecommendation')
+Range = get_model('offer', 'Range')
+RangeProduct = get_model('offer', 'RangeProduct')
+StockRecord = get_model('partner', 'StockRecord')
+Voucher = get_model('voucher', 'Voucher')
+WeightBand = get_model('shipping', 'WeightBand')
+WeightBased = get_model('shipping', 'WeightBased')
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def forget_cached_api_keys(sender, **kwargs):
+    invalidate_api_keys()
+
+
+@receiver(setting_changed)
+def forget_api_root(sender, setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        clear_api_root_cache()
+        clear_url_templates()
+
+
+# oscar saves offers and vouchers for every order to count their usage, which
+# does not change their discounts, so those saves should keep the caches.
+USAGE_FIELDS = {
+    ConditionalOffer: ('num_applications', 'total_discount', 'num_orders'),
+    Voucher: ('num_basket_additions', 'num_orders', 'total_discount'),
+}
+
+
+def get_definition(instance):
+    "Return the values of the fields of ``instance`` that are not counters."
+    usage_fields = USAGE_FIELDS[type(instance)]
+    if getattr(instance, 'max_global_applications', None) or \
+            getattr(instance, 'max_discount', None):
+        # the usage limits how often the offer can still be applied.
+        usage_fields = ()
+    return tuple(
+        instance.__dict__.get(field.attname)
+        for field in instance._meta.concrete_fields
+        if field.name not in usage_fields
+    )
+
+
+def definition_changed(instance):
+    "Check if ``instance`` changed since it was loaded or last saved."
+    definition = get_definition(instance)
+    changed = definition != getattr(instance, '_oscarapi_definition', None)
+    instance._oscarapi_definition = definition
+    return changed
+
+
+@receiver(post_init, sender=ConditionalOffer)
+@receiver(post_init, sender=Voucher)
+def remember_definition(sender, instance, **kwargs):
+    instance._oscarapi_definition = get_definition(instance)
+
+
+@receiver(post_save, sender=ConditionalOffer)
+def forget_cached_offer(sender, instance, created, **kwargs):
+    if created or definition_changed(instance):
+        invalidate_offer_cache()
+
+
+@receiver(post_save, sender=Voucher)
+def forget_cached_voucher(sender, instance, created, **kwargs):
+    if created or definition_changed(instance):
+        invalidate_offer_cache()
+        invalidate_vouchers()
+
+
+@receiver(post_delete, sender=ConditionalOffer)
+@receiver([post_save, post_delete], sender=Condition)
+@receiver([post_save, post_delete], sender=Benefit)
+@receiver([post_save, post_delete], sender=Range)
+@receiver([post_save, post_delete], sender=RangeProduct)
+@receiver(post_delete, sender=Voucher)
+@receiver(m2m_changed, sender=Range.excluded_products.through)
+@receiver(m2m_changed, sender=Range.classes.through)
+@receiver(m2m_changed, sender=Range.included_categories.through)
+@receiver(m2m_changed, sender=Voucher.offers.through)
+def forget_cached_offers(sender, **kwargs):
+    invalidate_offer_cache()
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductClass)
+@receiver([post_save, post_delete], sender=ProductCategory)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=ProductAttribute)
+@receiver([post_save, post_delete], sender=ProductAttributeValue)
+@receiver([post_save, post_delete], sender=AttributeOption)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductRecommendation)
+@receiver([post_save, post_delete], sender=Option)
+@receiver([post_save, post_delete], sender=Partner)
+@receiver([post_save, post_delete], sender=Country)
+@receiver(m2m_changed, sender=Product.product_options.through)
+@receiver(m2m_changed, sender=ProductClass.options.through)
+@receiver(m2m_changed,
+          sender=ProductAttributeValue.value_multi_option.through)
+def forget_catalogue_version(sender, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver([post_save, post_delete], sender=StockRecord)
+def forget_cached_stockrecords(sender, **kwargs):
+    invalidate_stockrecords()
+
+
+@receiver(post_delete, sender=Voucher)
+def forget_cached_vouchers(sender, **kwargs):
+    invalidate_vouchers()
+
+
+@receiver([post_save, post_delete], sender=OrderAndItemCharges)
+@receiver([post_save, post_delete], sender=WeightBased)
+@receiver([post_save, post_delete], sender=WeightBand)
+@receiver(m2m_changed, sender=OrderAndItemCharges.countries.through)
+@receiver(m2m_changed, sender=WeightBased.countries.through)
+def forget_cached_shipping_methods(sender, **kwargs):
+    invalidate_shipping_cache()
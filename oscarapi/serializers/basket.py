@@ -2,15 +2,20 @@ import logging
 from rest_framework import serializers
 
 from oscarapi.basket import operations
+from oscarapi.cache import get_voucher_by_code
 
 from oscarapi.utils import (
     overridable,
     OscarModelSerializer,
     OscarHyperlinkedModelSerializer,
-    DrillDownHyperlinkedIdentityField
+    DrillDownHyperlinkedIdentityField,
+    ExpandableHyperlinkedIdentityField,
+    HyperlinkedIdentityField,
+    HyperlinkedRelatedField
 )
 from oscarapi.serializers.fields import TaxIncludedDecimalField
 
+from django.db.models import Manager
 from django.utils.translation import ugettext as _
 from oscar.core.loading import get_model
 from decimal import Decimal
@@ -44,7 +49,10 @@ class VoucherDiscountSerializer(OfferDiscountSerializer):
 
 
 class BasketSerializer(serializers.HyperlinkedModelSerializer):
-    lines = serializers.HyperlinkedIdentityField(view_name='basket-lines-list')
+    serializer_related_field = HyperlinkedRelatedField
+    serializer_url_field = HyperlinkedIdentityField
+
+    lines = ExpandableHyperlinkedIdentityField(view_name='basket-lines-list')
     offer_discounts = OfferDiscountSerializer(many=True, required=False)
     total_excl_tax = serializers.DecimalField(
         decimal_places=2, max_digits=12, required=False)
@@ -71,6 +79,15 @@ class BasketSerializer(serializers.HyperlinkedModelSerializer):
             'total_incl_tax_excl_discounts', 'total_tax', 'currency',
             'voucher_discounts', 'offer_discounts', 'is_tax_known'))
 
+    def to_representation(self, obj):
+        operations.apply_offers_if_needed(self.context['request'], obj)
+        return super(BasketSerializer, self).to_representation(obj)
+
+    def expand_lines(self, obj):
+        # the fields query parameter is meant for the basket, not its lines
+        return BasketLineSerializer(
+            obj.all_lines(), many=True, fields=(), context=self.context).data
+
     def get_validation_exclusions(self, instance=None):
         """
         This is needed because oscar declared the owner field as ``null=True``,
@@ -87,6 +104,42 @@ class LineAttributeSerializer(OscarHyperlinkedModelSerializer):
         fields = '__all__'
 
 
+def _basket_lines_by_id(basket):
+    """
+    Index the in-memory lines of the basket by id.
+
+    The index is kept on the basket until the lines are reloaded, which
+    happens when offers are applied again.
+    """
+    lines = basket.all_lines()
+    index = getattr(basket, '_oscarapi_lines_by_id', None)
+    if index is None or index[0] is not lines:
+        index = (lines, dict((line.id, line) for line in lines))
+        basket._oscarapi_lines_by_id = index
+    return index[1]
+
+
+class BasketLineListSerializer(serializers.ListSerializer):
+    """
+    Serializes many basket lines, while preparing each basket only once.
+    """
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        request = self.context['request']
+
+        baskets = {}
+        representation = []
+        for obj in iterable:
+            basket = baskets.get(obj.basket_id)
+            if basket is None:
+                basket = baskets[obj.basket_id] = \
+                    operations.apply_offers_if_needed(request, obj.basket)
+            line = _basket_lines_by_id(basket).get(obj.id)
+            representation.append(self.child.to_representation(line))
+
+        return representation
+
+
 class BasketLineSerializer(OscarHyperlinkedModelSerializer):
     """
     This serializer computes the prices of this line by using the basket
@@ -121,6 +174,7 @@ class BasketLineSerializer(OscarHyperlinkedModelSerializer):
 
     class Meta:
         model = Line
+        list_serializer_class = BasketLineListSerializer
         fields = overridable('OSCARAPI_BASKETLINE_FIELDS', default=(
             'url', 'product', 'quantity', 'attributes', 'price_currency',
             'price_excl_tax', 'price_incl_tax',
@@ -131,14 +185,14 @@ class BasketLineSerializer(OscarHyperlinkedModelSerializer):
     def to_representation(self, obj):
         # This override is needed to reflect offer discounts or strategy
         # related prices immediately in the response
-        operations.assign_basket_strategy(obj.basket, self.context['request'])
+        basket = operations.apply_offers_if_needed(
+            self.context['request'], obj.basket)
 
         # Oscar stores the calculated discount in line._discount_incl_tax or
         # line._discount_excl_tax when offers are applied. So by just
         # retrieving the line from the db you will loose this values, that's
         # why we need to get the line from the in-memory resultset here
-        lines = (x for x in obj.basket.all_lines() if x.id == obj.id)
-        line = next(lines, None)
+        line = _basket_lines_by_id(basket).get(obj.id)
 
         return super(BasketLineSerializer, self).to_representation(line)
 
@@ -147,6 +201,9 @@ class LineSerializer(serializers.HyperlinkedModelSerializer):
     """
     This serializer just shows fields stored in the database for this line.
     """
+    serializer_related_field = HyperlinkedRelatedField
+    serializer_url_field = HyperlinkedIdentityField
+
     attributes = LineAttributeSerializer(
         many=True,
         fields=('url', 'option', 'value'),
@@ -173,23 +230,22 @@ class VoucherAddSerializer(serializers.Serializer):
         attrs['vouchercode'] = attrs['vouchercode'].upper()
 
         request = self.context.get('request')
-        try:
-            voucher = Voucher.objects.get(code=attrs.get('vouchercode'))
-
-            # check expiry date
-            if not voucher.is_active():
-                message = _("The '%(code)s' voucher has expired") % {
-                    'code': voucher.code
-                }
-                raise serializers.ValidationError(message)
-
-            # check voucher rules
-            is_available, message = voucher.is_available_to_user(request.user)
-            if not is_available:
-                raise serializers.ValidationError(message)
-        except Voucher.DoesNotExist:
+        voucher = get_voucher_by_code(attrs.get('vouchercode'))
+        if voucher is None:
             raise serializers.ValidationError(_('Voucher code unknown'))
 
+        # check expiry date
+        if not voucher.is_active():
+            message = _("The '%(code)s' voucher has expired") % {
+                'code': voucher.code
+            }
+            raise serializers.ValidationError(message)
+
+        # check voucher rules
+        is_available, message = voucher.is_available_to_user(request.user)
+        if not is_available:
+            raise serializers.ValidationError(message)
+
         # set instance to the voucher so we can use this in the view
         self.instance = voucher
         return attrs
@@ -1,25 +1,33 @@
 import warnings
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse, NoReverseMatch
+from django.db import transaction
 from django.utils.translation import gettext as _
 from oscar.core import prices
 from oscar.core.loading import get_class, get_model
 from rest_framework import serializers, exceptions
 
 from oscarapi.basket.operations import (
-    assign_basket_strategy,
+    Repository,
+    apply_offers_if_needed,
+    get_shipping_quotes,
 )
 from oscarapi.serializers import (
     VoucherSerializer,
     OfferDiscountSerializer
 )
 from oscarapi.utils import (
+    ExpandableHyperlinkedIdentityField,
     OscarHyperlinkedModelSerializer,
     OscarModelSerializer,
-    overridable
+    overridable,
+    HyperlinkedIdentityField,
+    HyperlinkedRelatedField
 )
 from oscarapi.serializers.fields import TaxIncludedDecimalField
+from oscarapi.serializers.product import AvailabilitySerializer
 
 
 OrderPlacementMixin = get_class('checkout.mixins', 'OrderPlacementMixin')
@@ -32,8 +40,8 @@ OrderLine = get_model('order', 'Line')
 OrderLineAttribute = get_model('order', 'LineAttribute')
 
 Basket = get_model('basket', 'Basket')
+BasketLine = get_model('basket', 'Line')
 Country = get_model('address', 'Country')
-Repository = get_class('shipping.repository', 'Repository')
 
 
 class PriceSerializer(serializers.Serializer):
@@ -49,6 +57,18 @@ class PriceSerializer(serializers.Serializer):
         decimal_places=2, max_digits=12, required=False)
 
 
+class PurchaseInfoSerializer(serializers.Serializer):
+    """
+    Serializes the price and availability of a product, as given by a dict
+    with the ``product`` and its ``price`` and ``availability``.
+    """
+    id = serializers.IntegerField(source='product.id')
+    url = HyperlinkedRelatedField(
+        view_name='product-detail', source='product', read_only=True)
+    price = PriceSerializer()
+    availability = AvailabilitySerializer()
+
+
 class CountrySerializer(OscarHyperlinkedModelSerializer):
     class Meta:
         model = Country
@@ -62,7 +82,7 @@ class ShippingAddressSerializer(OscarHyperlinkedModelSerializer):
 
 
 class InlineShippingAddressSerializer(OscarModelSerializer):
-    country = serializers.HyperlinkedRelatedField(
+    country = HyperlinkedRelatedField(
         view_name='country-detail', queryset=Country.objects)
 
     class Meta:
@@ -77,7 +97,7 @@ class BillingAddressSerializer(OscarHyperlinkedModelSerializer):
 
 
 class InlineBillingAddressSerializer(OscarModelSerializer):
-    country = serializers.HyperlinkedRelatedField(
+    country = HyperlinkedRelatedField(
         view_name='country-detail', queryset=Country.objects)
 
     class Meta:
@@ -91,12 +111,18 @@ class ShippingMethodSerializer(serializers.Serializer):
     price = serializers.SerializerMethodField('calculate_price')
 
     def calculate_price(self, obj):
-        price = obj.calculate(self.context.get('basket'))
+        # reuse the charges calculated by operations.get_shipping_quotes
+        for method, charge in self.context.get('shipping_quotes', ()):
+            if method is obj:
+                price = charge
+                break
+        else:
+            price = obj.calculate(self.context.get('basket'))
         return PriceSerializer(price).data
 
 
 class OrderLineAttributeSerializer(OscarHyperlinkedModelSerializer):
-    url = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(
         view_name='order-lineattributes-detail')
 
     class Meta:
@@ -107,7 +133,7 @@ class OrderLineAttributeSerializer(OscarHyperlinkedModelSerializer):
 class OrderLineSerializer(OscarHyperlinkedModelSerializer):
     "This serializer renames some fields so they match up with the basket"
 
-    url = serializers.HyperlinkedIdentityField(view_name='order-lines-detail')
+    url = HyperlinkedIdentityField(view_name='order-lines-detail')
     attributes = OrderLineAttributeSerializer(
         many=True, fields=('url', 'option', 'value'), required=False)
     price_currency = serializers.CharField(
@@ -147,9 +173,9 @@ class OrderSerializer(OscarHyperlinkedModelSerializer):
     basket. That way the same kind of logic can be used to display the order
     as the basket in the checkout process.
     """
-    owner = serializers.HyperlinkedRelatedField(
+    owner = HyperlinkedRelatedField(
         view_name='user-detail', read_only=True, source='user')
-    lines = serializers.HyperlinkedIdentityField(
+    lines = ExpandableHyperlinkedIdentityField(
         view_name='order-lines-list')
     shipping_address = InlineShippingAddressSerializer(
         many=False, required=False)
@@ -169,6 +195,11 @@ class OrderSerializer(OscarHyperlinkedModelSerializer):
         qs = obj.basket_discounts.filter(voucher_id__isnull=False)
         return OrderVoucherOfferSerializer(qs, many=True).data
 
+    def expand_lines(self, obj):
+        # the fields query parameter is meant for the order, not its lines
+        return OrderLineSerializer(
+            obj.lines.all(), many=True, fields=(), context=self.context).data
+
     def get_payment_url(self, obj):
         try:
             return reverse('api-payment', args=(obj.pk,))
@@ -189,10 +220,11 @@ class OrderSerializer(OscarHyperlinkedModelSerializer):
             'guest_email', 'date_placed', 'payment_url', 'offer_discounts',
             'voucher_discounts')
         )
+        expand_prefetch_related = {'lines': ('lines__attributes',)}
 
 
 class CheckoutSerializer(serializers.Serializer, OrderPlacementMixin):
-    basket = serializers.HyperlinkedRelatedField(
+    basket = HyperlinkedRelatedField(
         view_name='basket-detail', queryset=Basket.objects)
     guest_email = serializers.EmailField(allow_blank=True, required=False)
     total = serializers.DecimalField(
@@ -223,8 +255,13 @@ class CheckoutSerializer(serializers.Serializer, OrderPlacementMixin):
                 # Don't store guest_email field if the user is authenticated
                 del attrs['guest_email']
 
+        # the view passes the basket it already loaded, which might have
+        # been priced during this request.
         basket = attrs.get('basket')
-        basket = assign_basket_strategy(basket, request)
+        context_basket = self.context.get('basket')
+        if context_basket is not None and context_basket.pk == basket.pk:
+            basket = context_basket
+        basket = apply_offers_if_needed(request, basket)
         if basket.num_items <= 0:
             message = _('Cannot checkout with empty basket')
             raise serializers.ValidationError(message)
@@ -234,7 +271,8 @@ class CheckoutSerializer(serializers.Serializer, OrderPlacementMixin):
             attrs.get('shipping_method_code'),
             attrs.get('shipping_address')
         )
-        shipping_charge = shipping_method.calculate(basket)
+        shipping_charge = self._shipping_charge(
+            request, basket, shipping_method, attrs.get('shipping_address'))
         posted_shipping_charge = attrs.get('shipping_charge')
 
         if posted_shipping_charge is not None:
@@ -261,59 +299,109 @@ class CheckoutSerializer(serializers.Serializer, OrderPlacementMixin):
         attrs['shipping_method'] = shipping_method
         attrs['shipping_charge'] = shipping_charge
         attrs['basket'] = basket
+        attrs['basket_fingerprint'] = self._basket_fingerprint(basket)
         return attrs
 
+    def _basket_fingerprint(self, basket):
+        """
+        Fingerprint the basket as it was priced: its lines with their prices
+        and discounts, and the offers that were applied to it.
+        """
+        lines = []
+        for line in basket.all_lines():
+            price = line.purchase_info.price
+            lines.append((
+                line.pk, line.product_id, line.stockrecord_id, line.quantity,
+                price.excl_tax, price.incl_tax if price.is_tax_known else None,
+                line._discount_excl_tax, line._discount_incl_tax
+            ))
+        applications = [
+            (application['offer'].pk,
+             getattr(application['voucher'], 'pk', None),
+             application['freq'], application['discount'])
+            for application in basket.offer_applications
+        ]
+        return lines, applications
+
+    def _lock_lines(self, basket):
+        "Lock the stored lines of the basket and return what was ordered"
+        return list(
+            BasketLine.objects.select_for_update().filter(basket=basket)
+            .order_by('pk')
+            .values_list('pk', 'product_id', 'stockrecord_id', 'quantity'))
+
     def create(self, validated_data):
         try:
-            basket = validated_data.get('basket')
-            order_number = self.generate_order_number(basket)
-            request = self.context['request']
-
-            shipping_address = ShippingAddress(
-                **validated_data['shipping_address'])
-
-            if 'billing_address' in validated_data:
-                billing_address = BillingAddress(
-                    **validated_data['billing_address'])
-            else:
-                billing_address = None
-
-            return self.place_order(
-                order_number=order_number,
-                user=request.user,
-                basket=basket,
-                shipping_address=shipping_address,
-                shipping_method=validated_data.get('shipping_method'),
-                shipping_charge=validated_data.get('shipping_charge'),
-                billing_address=billing_address,
-                order_total=validated_data.get('total'),
-                guest_email=validated_data.get('guest_email') or ''
-            )
+            with transaction.atomic():
+                return self._create(validated_data)
         except ValueError as e:
             raise exceptions.NotAcceptable(e.message)
 
-    def _shipping_method(self, request, basket,
-                         shipping_method_code, shipping_address):
-        repo = Repository()
+    def _create(self, validated_data):
+        basket = validated_data.get('basket')
+        # the validated prices and totals are used for the order, so refuse
+        # it when the basket was changed since, and keep it from changing
+        # until the order is placed.
+        fingerprint = validated_data.get('basket_fingerprint')
+        if fingerprint is not None:
+            lines = [line[:4] for line in fingerprint[0]]
+            if fingerprint != self._basket_fingerprint(basket) or \
+                    lines != self._lock_lines(basket):
+                raise exceptions.NotAcceptable(
+                    _('The basket changed during checkout'))
+
+        order_number = self.generate_order_number(basket)
+        request = self.context['request']
 
-        default = repo.get_default_shipping_method(
-            basket=basket,
+        shipping_address = ShippingAddress(
+            **validated_data['shipping_address'])
+
+        if 'billing_address' in validated_data:
+            billing_address = BillingAddress(
+                **validated_data['billing_address'])
+        else:
+            billing_address = None
+
+        return self.place_order(
+            order_number=order_number,
             user=request.user,
-            request=request,
-            shipping_addr=shipping_address
+            basket=basket,
+            shipping_address=shipping_address,
+            shipping_method=validated_data.get('shipping_method'),
+            shipping_charge=validated_data.get('shipping_charge'),
+            billing_address=billing_address,
+            order_total=validated_data.get('total'),
+            guest_email=validated_data.get('guest_email') or ''
         )
 
-        if shipping_method_code is not None:
-            methods = repo.get_shipping_methods(
-                basket=basket,
-                user=request.user,
-                request=request,
-                shipping_addr=shipping_address
-            )
+    def _shipping_method(self, request, basket,
+                         shipping_method_code, shipping_address):
+        quotes = get_shipping_quotes(request, basket, shipping_address)
+        if not quotes:
+            raise ImproperlyConfigured(
+                _("You need to define some shipping methods"))
 
+        if shipping_method_code is not None:
             find_method = (
-                s for s in methods if s.code == shipping_method_code)
-            shipping_method = next(find_method, default)
-            return shipping_method
-
-        return default
+                method for method, charge in quotes
+                if method.code == shipping_method_code)
+            shipping_method = next(find_method, None)
+            if shipping_method is not None:
+                return shipping_method
+
+        # let the repository pick the default from the methods it already
+        # returned, instead of looking them up again.
+        methods = [method for method, charge in quotes]
+        repository = Repository()
+        repository.get_shipping_methods = lambda *args, **kwargs: methods
+        return repository.get_default_shipping_method(
+            basket=basket, user=request.user, request=request,
+            shipping_addr=shipping_address or None)
+
+    def _shipping_charge(self, request, basket,
+                         shipping_method, shipping_address):
+        quotes = get_shipping_quotes(request, basket, shipping_address)
+        for method, charge in quotes:
+            if method is shipping_method:
+                return charge
+        return shipping_method.calculate(basket)
@@ -1,9 +1,16 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 
+from oscarapi.loading import get_api_class
 from oscarapi.utils import (
     OscarModelSerializer,
     overridable,
-    OscarHyperlinkedModelSerializer
+    OscarHyperlinkedModelSerializer,
+    ExpandableHyperlinkedIdentityField,
+    get_strategy,
+    HyperlinkedIdentityField,
+    HyperlinkedPrimaryKeyField,
+    HyperlinkedRelatedField
 )
 from oscar.core.loading import get_model
 
@@ -71,7 +78,7 @@ class AvailabilitySerializer(serializers.Serializer):
 
 
 class RecommmendedProductSerializer(OscarModelSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='product-detail')
+    url = HyperlinkedIdentityField(view_name='product-detail')
 
     class Meta:
         model = Product
@@ -80,16 +87,16 @@ class RecommmendedProductSerializer(OscarModelSerializer):
 
 
 class ProductSerializer(OscarModelSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='product-detail')
-    stockrecords = serializers.HyperlinkedIdentityField(
+    url = HyperlinkedIdentityField(view_name='product-detail')
+    stockrecords = ExpandableHyperlinkedIdentityField(
         view_name='product-stockrecord-list')
     attributes = ProductAttributeValueSerializer(
         many=True, required=False, source="attribute_values")
     categories = serializers.StringRelatedField(many=True, required=False)
     product_class = serializers.StringRelatedField(required=False)
     images = ProductImageSerializer(many=True, required=False)
-    price = serializers.HyperlinkedIdentityField(view_name='product-price')
-    availability = serializers.HyperlinkedIdentityField(
+    price = ExpandableHyperlinkedIdentityField(view_name='product-price')
+    availability = ExpandableHyperlinkedIdentityField(
         view_name='product-availability')
     options = OptionSerializer(many=True, required=False)
     recommended_products = RecommmendedProductSerializer(
@@ -104,10 +111,50 @@ class ProductSerializer(OscarModelSerializer):
                 'date_created', 'date_updated', 'recommended_products',
                 'attributes', 'categories', 'product_class',
                 'stockrecords', 'images', 'price', 'availability', 'options'))
+        select_related = {'product_class': ('product_class',)}
+        prefetch_related = {
+            'attributes': (
+                Prefetch('attribute_values',
+                         queryset=ProductAttributeValue.objects.select_related(
+                             'attribute', 'value_option')),),
+            'categories': ('categories',),
+            'images': ('images',),
+            'options': ('product_options', 'product_class__options'),
+            'recommended_products': ('recommended_products',),
+        }
+        expand_prefetch_related = {
+            'stockrecords': ('stockrecords',),
+            'price': ('stockrecords', 'children__stockrecords'),
+            'availability': ('stockrecords', 'children__stockrecords'),
+        }
+
+    def get_purchase_info(self, obj):
+        # price and availability are expanded from the same purchase info.
+        if not hasattr(obj, '_oscarapi_purchase_info'):
+            strategy = get_strategy(self.context['request'])
+            obj._oscarapi_purchase_info = strategy.fetch_for_product(obj)
+        return obj._oscarapi_purchase_info
+
+    def expand_stockrecords(self, obj):
+        StockRecordSerializer = get_api_class(
+            'oscarapi.serializers.basket', 'StockRecordSerializer')
+        return StockRecordSerializer(
+            obj.stockrecords.all(), many=True, context=self.context).data
+
+    def expand_price(self, obj):
+        PriceSerializer = get_api_class(
+            'oscarapi.serializers.checkout', 'PriceSerializer')
+        return PriceSerializer(
+            self.get_purchase_info(obj).price, context=self.context).data
+
+    def expand_availability(self, obj):
+        return AvailabilitySerializer(
+            self.get_purchase_info(obj).availability,
+            context=self.context).data
 
 
 class OptionValueSerializer(serializers.Serializer):
-    option = serializers.HyperlinkedRelatedField(
+    option = HyperlinkedRelatedField(
         view_name='option-detail', queryset=Option.objects)
     value = serializers.CharField()
 
@@ -117,9 +164,19 @@ class AddProductSerializer(serializers.Serializer):
     Serializes and validates an add to basket request.
     """
     quantity = serializers.IntegerField(required=True)
-    url = serializers.HyperlinkedRelatedField(
+    url = HyperlinkedRelatedField(
         view_name='product-detail', queryset=Product.objects, required=True)
     options = OptionValueSerializer(many=True, required=False)
 
     class Meta:
         model = Product
+
+
+class AddProductsSerializer(AddProductSerializer):
+    """
+    Serializes and validates one of the products of an add to basket request
+    for many products. The url is validated to the id of the product, so all
+    products can be loaded at once.
+    """
+    url = HyperlinkedPrimaryKeyField(
+        view_name='product-detail', queryset=Product.objects, required=True)
@@ -0,0 +1,80 @@
+"""
+Cache first, database backed sessions with write-behind persistence.
+"""
+import time
+
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import (
+    SessionStore as CachedDBStore)
+
+from oscarapi.utils import overridable
+
+KEY_PREFIX = "oscarapi.sessions.cached_db"
+
+
+class SessionStore(CachedDBStore):
+    """
+    Implements cache first sessions which are written behind to the database.
+
+    Sessions are read from and written to the cache. The database is only
+    read when a session is not found in the cache, and only written when a
+    session is created or when the copy in the database is older than
+    ``OSCARAPI_SESSION_PERSIST_INTERVAL`` seconds. Saving a session that was
+    not modified doesn't write anything at all.
+
+    Changes made since the session was last written to the database are lost
+    when the cache evicts the session, so use a cache which is big enough to
+    hold all active sessions.
+    """
+    cache_key_prefix = KEY_PREFIX
+
+    # the time the session was last written to the database, None means the
+    # session was not loaded from the cache or the database.
+    persisted = None
+
+    def load(self):
+        try:
+            cached = self._cache.get(self.cache_key)
+        except Exception:
+            # Some backends (e.g. memcache) raise an exception on invalid
+            # cache keys. If this happens, reset the session. See #17810.
+            cached = None
+
+        if cached is not None:
+            data, self.persisted = cached
+            return data
+
+        # skip the cache of the cached_db backend, it uses a different format.
+        data = super(CachedDBStore, self).load()
+        if self.session_key is not None:
+            self.persisted = time.time()
+            # pass the expiry, because the session is not loaded yet.
+            expiry_age = self.get_expiry_age(
+                expiry=data.get('_session_expiry'))
+            self._cache.set(self.cache_key, (data, self.persisted), expiry_age)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        if not (must_create or self.modified or self.persisted is None):
+            return
+
+        interval = overridable('OSCARAPI_SESSION_PERSIST_INTERVAL', 300)
+        now = time.time()
+        if self.persisted is None and not must_create:
+            # the session was never found, so it is probably new.
+            try:
+                super(CachedDBStore, self).save(must_create=True)
+            except CreateError:
+                super(CachedDBStore, self).save()
+            self.persisted = now
+        elif must_create or now - self.persisted >= interval:
+            super(CachedDBStore, self).save(must_create)
+            self.persisted = now
+
+        self._cache.set(
+            self.cache_key,
+            (self._get_session(no_load=must_create), self.persisted),
+            self.get_expiry_age())
@@ -1,12 +1,19 @@
 import json
+import mock
 import re
 
 from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
 from django.core.urlresolvers import reverse
+from django.test import RequestFactory, TestCase
+from django.contrib.auth.models import AnonymousUser
 
 from oscar.core.loading import get_model
 
+from oscarapi.basket import operations
+from oscarapi.serializers.product import AddProductsSerializer
 from oscarapi.tests.utils import APITest
+from oscarapi.utils import get_strategy
 
 
 Basket = get_model('basket', 'Basket')
@@ -959,6 +966,82 @@ class BasketTest(APITest):
             quantity=25)
         self.response.assertStatusEqual(406)
 
+    def test_add_products(self):
+        "Test if many products can be added to the basket at once"
+        self.response = self.client.post(
+            reverse('api-basket-add-products'), json.dumps([
+                {'url': "http://testserver/api/products/1/", 'quantity': 5},
+                {'url': "http://testserver/api/products/2/", 'quantity': 1},
+            ]), content_type='application/json')
+        self.response.assertStatusEqual(200)
+
+        self.response = self.get(self.response['lines'])
+        self.assertEqual(len(self.response.body), 2)
+        quantities = dict(
+            (line['product'], line['quantity']) for line in self.response.body)
+        self.assertEqual(quantities, {
+            "http://testserver/api/products/1/": 5,
+            "http://testserver/api/products/2/": 1,
+        })
+
+    def test_add_products_validates_without_queries(self):
+        "The posted products should only be loaded once, by the view"
+        request = RequestFactory().post('/')
+        serializer = AddProductsSerializer(data=[
+            {'url': "http://testserver/api/products/1/", 'quantity': 5},
+            {'url': "http://testserver/api/products/2/", 'quantity': 1},
+        ], many=True, context={'request': request})
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(
+            [item['url'] for item in serializer.validated_data], [1, 2])
+
+    def test_add_products_unknown_product(self):
+        "Test if no products are added when one of them does not exist"
+        self.response = self.client.post(
+            reverse('api-basket-add-products'), json.dumps([
+                {'url': "http://testserver/api/products/1/", 'quantity': 5},
+                {'url': "http://testserver/api/products/999/", 'quantity': 1},
+            ]), content_type='application/json')
+        self.response.assertStatusEqual(406)
+        reasons = self.response['reason']
+        self.assertIsNone(reasons[0])
+        self.assertIn('url', reasons[1])
+
+        self.response = self.get('api-basket')
+        self.response = self.get(self.response['lines'])
+        self.assertEqual(len(self.response.body), 0)
+
+    def test_add_products_invalid_product(self):
+        "Test if the products that are fine are marked with null"
+        self.response = self.client.post(
+            reverse('api-basket-add-products'), json.dumps([
+                {'url': "http://testserver/api/products/1/", 'quantity': 5},
+                {'url': "http://testserver/api/koe/", 'quantity': 1},
+            ]), content_type='application/json')
+        self.response.assertStatusEqual(406)
+        reasons = self.response['reason']
+        self.assertIsNone(reasons[0])
+        self.assertIn('url', reasons[1])
+
+    def test_add_products_above_stock(self):
+        "Test if no products are added when the quantities add up above stock"
+        self.response = self.client.post(
+            reverse('api-basket-add-products'), json.dumps([
+                {'url': "http://testserver/api/products/2/", 'quantity': 1},
+                {'url': "http://testserver/api/products/1/", 'quantity': 12},
+                {'url': "http://testserver/api/products/1/", 'quantity': 12},
+            ]), content_type='application/json')
+        self.response.assertStatusEqual(406)
+        reasons = self.response['reason']
+        self.assertIsNone(reasons[0])
+        self.assertTrue(reasons[1])
+        self.assertTrue(reasons[2])
+
+        self.response = self.get('api-basket')
+        self.response = self.get(self.response['lines'])
+        self.assertEqual(len(self.response.body), 0)
+
     def test_adjust_basket_line_quantity(self):
         """Test if we can update the quantity of a line"""
         self.response = self.post(
@@ -980,3 +1063,77 @@ class BasketTest(APITest):
         self.response = self.get(basket_line_url)
         self.response.assertStatusEqual(200)
         self.response.assertValueEqual('quantity', 4)
+
+    def test_basket_session_is_only_saved_when_changed(self):
+        "The session should not be written when the basket stays the same"
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            self.response = self.get('api-basket', session_id='koe')
+            self.response.assertStatusEqual(200)
+
+            with mock.patch.object(SessionStore, 'save') as save:
+                self.response = self.get('api-basket', session_id='koe')
+                self.response.assertStatusEqual(200)
+                self.assertFalse(save.called)
+
+    def test_basket_lines_apply_offers_once(self):
+        "Listing the lines of a basket should apply the offers only once"
+        for product_url in ("http://testserver/api/products/1/",
+                            "http://testserver/api/products/2/"):
+            self.response = self.post(
+                'api-basket-add-product', url=product_url, quantity=2)
+            self.response.assertStatusEqual(200)
+
+        self.response = self.get('api-basket')
+        self.response.assertStatusEqual(200)
+        lines_url = self.response['lines']
+
+        with mock.patch('oscarapi.basket.operations.Applicator') as applicator:
+            self.response = self.get(lines_url)
+            self.response.assertStatusEqual(200)
+            self.assertEqual(len(self.response.data), 2)
+            self.assertEqual(applicator.return_value.apply.call_count, 1)
+
+    def test_basket_list_shares_offers(self):
+        "The admin basket list should look up the site offers only once"
+        self.hlogin('nobody', 'nobody', session_id='nobody')
+        for session_id, authenticated in (('koe', False), ('nobody', True)):
+            self.response = self.post(
+                'api-basket-add-product',
+                url="http://testserver/api/products/1/", quantity=2,
+                session_id=session_id, authenticated=authenticated)
+            self.response.assertStatusEqual(200)
+
+        with self.settings(OSCARAPI_BLOCK_ADMIN_API_ACCESS=False):
+            self.login('admin', 'admin')
+            with mock.patch('oscarapi.basket.operations.Applicator',
+                            side_effect=operations.Applicator) as applicator:
+                self.response = self.get('basket-list')
+                self.response.assertStatusEqual(200)
+                self.assertEqual(len(self.response.data), 2)
+                self.assertEqual(applicator.call_count, 1)
+
+    def test_basket_expand_lines(self):
+        "The lines of the basket should be embedded when asked for"
+        self.response = self.post(
+            'api-basket-add-product',
+            url="http://testserver/api/products/1/", quantity=5)
+        self.response.assertStatusEqual(200)
+        self.response = self.get(self.response['lines'])
+        lines = self.response.body
+
+        self.response = self.get(reverse('api-basket') + '?expand=lines')
+        self.response.assertStatusEqual(200)
+        self.response.assertValueEqual('lines', lines)
+
+
+class StrategyTest(TestCase):
+    def test_strategy_is_made_once_per_request(self):
+        "The strategy should be shared by everything handling a request"
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with mock.patch('oscarapi.utils.Selector') as selector:
+            strategy = get_strategy(request)
+            self.assertIs(get_strategy(request), strategy)
+            basket = operations.assign_basket_strategy(Basket(), request)
+            self.assertIs(basket.strategy, strategy)
+            self.assertEqual(selector.return_value.strategy.call_count, 1)
@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
 import unittest
+from decimal import Decimal
+from django.core.cache import cache
 from mock import patch
 
 from oscar.core.loading import get_model
+from oscarapi.basket.operations import (
+    Applicator,
+    Repository,
+    invalidate_offer_cache
+)
+from oscarapi.serializers.checkout import CheckoutSerializer
 from oscarapi.tests.utils import APITest
 
 
 Basket = get_model('basket', 'Basket')
+Line = get_model('basket', 'Line')
+Order = get_model('order', 'Order')
+OrderAndItemCharges = get_model('shipping', 'OrderAndItemCharges')
 
 
 class CheckOutTest(APITest):
@@ -390,6 +401,135 @@ class CheckOutTest(APITest):
             self.assertEqual(response.data['guest_email'], 'henk@example.com')
             self.assertEqual(Basket.objects.get(pk=basket_id).status, 'Frozen', 'Basket should be frozen after placing order and before payment')
 
+    def test_checkout_shipping_methods_once(self):
+        "The shipping methods should only be looked up once during checkout"
+        with patch.object(Repository, 'get_shipping_methods', autospec=True,
+                          side_effect=Repository.get_shipping_methods) \
+                as get_shipping_methods:
+            self.test_checkout()
+            self.assertEqual(get_shipping_methods.call_count, 1)
+
+    def test_checkout_default_shipping_method(self):
+        "The repository should pick the default shipping method"
+        with patch.object(Repository, 'get_default_shipping_method',
+                          autospec=True,
+                          side_effect=Repository.get_default_shipping_method) \
+                as get_default_shipping_method, \
+                patch.object(Repository, 'get_shipping_methods',
+                             autospec=True,
+                             side_effect=Repository.get_shipping_methods) \
+                as get_shipping_methods:
+            self.test_checkout_implicit_shipping()
+            self.assertEqual(get_default_shipping_method.call_count, 1)
+            self.assertEqual(get_shipping_methods.call_count, 1)
+
+    def test_checkout_applies_offers_once(self):
+        "The order should be placed with the prices that were validated"
+        with patch.object(Applicator, 'apply', autospec=True,
+                          side_effect=Applicator.apply) as apply:
+            self.test_checkout()
+            # once when adding the product and once for the checkout
+            self.assertEqual(apply.call_count, 2)
+
+    def checkout_changed_basket(self, change_basket):
+        "Check out, calling change_basket between validating and placing"
+        validate = CheckoutSerializer.validate
+
+        def validate_and_change_basket(serializer, attrs):
+            attrs = validate(serializer, attrs)
+            change_basket(attrs['basket'])
+            return attrs
+
+        self.login(username='nobody', password='nobody')
+        response = self.post(
+            'api-basket-add-product',
+            url="http://testserver/api/products/1/", quantity=5)
+        self.assertEqual(response.status_code, 200)
+        basket_url = self.get('api-basket').data['url']
+
+        request = {
+            'basket': basket_url,
+            'total': '50.0',
+            "shipping_address": {
+                "country": "http://127.0.0.1:8000/api/countries/NL/",
+                "first_name": "Henk",
+                "last_name": "Van den Heuvel",
+                "line1": "Roemerlaan 44",
+                "line4": "Kroekingen",
+                "postcode": "7777KK",
+                "title": "Mr"
+            }
+        }
+        with patch.object(CheckoutSerializer, 'validate', autospec=True,
+                          side_effect=validate_and_change_basket):
+            return self.post('api-checkout', **request)
+
+    def test_checkout_refuses_changed_basket(self):
+        "No order should be placed when the basket changed after validation"
+        response = self.checkout_changed_basket(
+            lambda basket: Line.objects.filter(basket=basket).update(
+                quantity=10))
+        self.assertEqual(response.status_code, 406)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_refuses_repriced_basket(self):
+        "No order should be placed when the basket was repriced"
+        response = self.checkout_changed_basket(
+            lambda basket: basket.all_lines()[0].discount(Decimal('1.00'), 1))
+        self.assertEqual(response.status_code, 406)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_ignores_other_changes(self):
+        "Changes to other baskets and offers should not refuse the order"
+        response = self.checkout_changed_basket(
+            lambda basket: invalidate_offer_cache())
+        self.assertEqual(response.status_code, 200)
+
+    def test_shipping_methods_are_cached(self):
+        "The shipping methods of the same basket should be cached"
+        cache.clear()
+        self.login(username='nobody', password='nobody')
+        response = self.post(
+            'api-basket-add-product',
+            url="http://testserver/api/products/1/", quantity=5)
+        self.assertEqual(response.status_code, 200)
+
+        with self.settings(OSCARAPI_SHIPPING_CACHE_TIMEOUT=300):
+            response = self.get('api-basket-shipping-methods')
+            self.assertEqual(response.status_code, 200)
+            shipping_methods = response.data
+
+            with patch.object(Repository, 'get_shipping_methods') \
+                    as get_shipping_methods:
+                response = self.get('api-basket-shipping-methods')
+                self.assertEqual(response.data, shipping_methods)
+                self.assertFalse(get_shipping_methods.called)
+
+    def test_cached_shipping_methods_are_refreshed(self):
+        "Changing a shipping method should make the cached ones stale"
+        cache.clear()
+        self.login(username='nobody', password='nobody')
+        response = self.post(
+            'api-basket-add-product',
+            url="http://testserver/api/products/1/", quantity=5)
+        self.assertEqual(response.status_code, 200)
+
+        with self.settings(OSCARAPI_SHIPPING_CACHE_TIMEOUT=300):
+            response = self.get('api-basket-shipping-methods')
+            self.assertEqual(response.status_code, 200)
+
+            method = OrderAndItemCharges.objects.get(code='by-foot')
+            method.price_per_order = 10
+            method.save()
+
+            with patch.object(Repository, 'get_shipping_methods',
+                              autospec=True,
+                              side_effect=Repository.get_shipping_methods) \
+                    as get_shipping_methods:
+                response = self.get('api-basket-shipping-methods')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(get_shipping_methods.call_count, 1)
+
     @patch('oscarapi.signals.oscarapi_post_checkout.send')
     def test_post_checkout_signal_send(self, mock):
         "The oscarapi_post_checkout signal should be send after checkout"
@@ -189,6 +189,83 @@ class SessionTest(APITest):
             self._run_expired_session_test_for_engine()
         with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db'):
             self._run_expired_session_test_for_engine()
+        with self.settings(SESSION_ENGINE='oscarapi.sessions.cached_db'):
+            self._run_expired_session_test_for_engine()
+
+    def test_get_session_creates_session(self):
+        "get_session should store a new session for an unknown id"
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            session = get_session('newsession')
+            self.assertEqual(session.session_key, 'newsession')
+            self.assertTrue(
+                Session.objects.filter(session_key='newsession').exists())
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.cache'):
+            session = get_session('newsession')
+            self.assertEqual(session.session_key, 'newsession')
+            self.assertTrue(session.exists('newsession'))
+
+    def test_write_behind_session_engine_new_session(self):
+        "A session that was never stored should be created in the database"
+        with self.settings(SESSION_ENGINE='oscarapi.sessions.cached_db'):
+            engine = import_module(settings.SESSION_ENGINE)
+            # like get_session does, start the session without loading it.
+            session = engine.SessionStore('neverstored')
+            session._session_cache = {'touched': 'writesomething'}
+            session.save()
+            stored = Session.objects.get(session_key='neverstored')
+            self.assertEqual(stored.get_decoded()['touched'], 'writesomething')
+
+    def test_write_behind_session_engine(self):
+        "The oscarapi session engine only writes to the database occasionally"
+        with self.settings(SESSION_ENGINE='oscarapi.sessions.cached_db',
+                           OSCARAPI_SESSION_PERSIST_INTERVAL=300):
+            session = get_session('writebehind')
+            self.assertTrue(
+                Session.objects.filter(session_key='writebehind').exists())
+
+            with self.assertNumQueries(0):
+                session = get_session('writebehind')
+                session['touched'] = 'writesomething'
+                session.save()
+
+            # a session that is not modified is not saved at all
+            with self.assertNumQueries(0):
+                session = get_session('writebehind')
+                self.assertEqual(session['touched'], 'writesomething')
+                session.save()
+
+            stored = Session.objects.get(session_key='writebehind')
+            self.assertNotIn('touched', stored.get_decoded())
+
+            # once the interval has passed, the database is updated
+            with self.settings(OSCARAPI_SESSION_PERSIST_INTERVAL=0):
+                session['touched'] = 'writesomethingelse'
+                session.save()
+
+            stored = Session.objects.get(session_key='writebehind')
+            self.assertEqual(stored.get_decoded()['touched'], 'writesomethingelse')
+
+    def test_get_session_loads_once(self):
+        "Resuming a session should take a single query"
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            session = get_session('session1')
+            session['touched'] = 'writesomething'
+            session.save()
+
+            with self.assertNumQueries(1):
+                session = get_session('session1')
+                self.assertEqual(session['touched'], 'writesomething')
+
+    def test_get_session_leaves_other_expired_sessions(self):
+        "Purging expired sessions is left to the clearsessions command"
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            with self.settings(SESSION_COOKIE_AGE=-10000):
+                get_session('session1').save()
+                get_session('session2').save()
+
+            session = get_session('session1')
+            self.assertEqual(session.session_key, 'session1')
+            self.assertTrue(Session.objects.filter(session_key='session2').exists())
 
     def _run_expired_session_test_for_engine(self):
         # establish that get_session will return the same session
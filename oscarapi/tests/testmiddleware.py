@@ -0,0 +1,192 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory, TestCase
+from mock import patch
+
+from oscarapi.basket import operations
+from oscarapi.cache import (
+    API_KEY_CACHE_PREFIX,
+    api_key_cache,
+    api_key_is_valid,
+    bump_generation
+)
+from oscarapi.middleware import IsApiRequest, clear_api_root_cache
+from oscarapi.models import ApiKey
+from oscarapi.tests.utils import APITest
+
+
+class ApiGatewayMiddleWareTest(APITest):
+    def setUp(self):
+        api_key_cache.clear()
+        ApiKey.objects.create(key='koe')
+        super(ApiGatewayMiddleWareTest, self).setUp()
+
+    def gateway_settings(self):
+        return self.settings(
+            MIDDLEWARE_CLASSES=(
+                'oscarapi.middleware.ApiGatewayMiddleWare',
+            ) + tuple(settings.MIDDLEWARE_CLASSES)
+        )
+
+    def test_invalid_key(self):
+        "Requests without a valid key are refused"
+        with self.gateway_settings():
+            response = self.client.get('/api/', HTTP_AUTHORIZATION='paard')
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get('/api/')
+            self.assertEqual(response.status_code, 403)
+
+    def test_valid_key(self):
+        "Requests with a valid key are allowed"
+        with self.gateway_settings():
+            response = self.client.get('/api/', HTTP_AUTHORIZATION='koe')
+            self.assertEqual(response.status_code, 200)
+
+    def test_keys_are_cached(self):
+        "Validating a key should only hit the database once"
+        with self.gateway_settings():
+            self.client.get('/api/', HTTP_AUTHORIZATION='koe')
+            self.client.get('/api/', HTTP_AUTHORIZATION='paard')
+            with self.assertNumQueries(0):
+                self.assertTrue(api_key_is_valid(b'koe'))
+                self.assertFalse(api_key_is_valid(b'paard'))
+
+    def test_changed_keys_are_not_cached(self):
+        "Changing or deleting a key invalidates the cache"
+        with self.gateway_settings():
+            self.client.get('/api/', HTTP_AUTHORIZATION='koe')
+            self.client.get('/api/', HTTP_AUTHORIZATION='paard')
+
+            ApiKey.objects.create(key='paard')
+            response = self.client.get('/api/', HTTP_AUTHORIZATION='paard')
+            self.assertEqual(response.status_code, 200)
+
+            ApiKey.objects.get(key='koe').delete()
+            response = self.client.get('/api/', HTTP_AUTHORIZATION='koe')
+            self.assertEqual(response.status_code, 403)
+
+    def test_shared_cache(self):
+        "The local cache can be backed by the django cache"
+        with self.gateway_settings(), \
+                self.settings(OSCARAPI_APIKEY_SHARED_CACHE=True):
+            self.client.get('/api/', HTTP_AUTHORIZATION='koe')
+            api_key_cache.clear()
+            with self.assertNumQueries(0):
+                self.assertTrue(api_key_is_valid(b'koe'))
+
+            ApiKey.objects.get(key='koe').delete()
+            response = self.client.get('/api/', HTTP_AUTHORIZATION='koe')
+            self.assertEqual(response.status_code, 403)
+
+    def test_revoked_keys_expire_shortly(self):
+        "Without the shared cache, valid keys are only remembered shortly"
+        self.assertTrue(api_key_is_valid(b'koe'))
+        ApiKey.objects.filter(key='koe').update(key='paard')
+        self.assertTrue(api_key_is_valid(b'koe'))
+
+        expired = time.time() + 11
+        with patch('oscarapi.cache.time.time', return_value=expired):
+            self.assertFalse(api_key_is_valid(b'koe'))
+
+    def test_shared_cache_invalidates_local_cache(self):
+        "Keys changed by another process are not valid in the local cache"
+        cache.clear()
+        with self.settings(OSCARAPI_APIKEY_SHARED_CACHE=True):
+            self.assertTrue(api_key_is_valid(b'koe'))
+
+            # what invalidate_api_keys does in another process
+            ApiKey.objects.filter(key='koe').update(key='paard')
+            bump_generation(API_KEY_CACHE_PREFIX)
+            self.assertFalse(api_key_is_valid(b'koe'))
+
+
+class IsApiRequestTest(TestCase):
+    def setUp(self):
+        clear_api_root_cache()
+        self.factory = RequestFactory()
+
+    def test_is_api_request(self):
+        is_api_request = IsApiRequest.is_api_request
+        self.assertTrue(is_api_request(self.factory.get('/api/')))
+        self.assertTrue(is_api_request(self.factory.get('/API/products/')))
+        self.assertFalse(is_api_request(self.factory.get('/catalogue/')))
+
+    @patch('oscarapi.middleware.reverse', side_effect=reverse)
+    def test_api_root_is_reversed_once(self, mock_reverse):
+        "The api root is only reversed once per urlconf"
+        request = self.factory.get('/api/')
+        self.assertTrue(IsApiRequest.is_api_request(request))
+        self.assertTrue(IsApiRequest.is_api_request(request))
+        self.assertTrue(IsApiRequest.is_api_request(self.factory.get('/api/')))
+        self.assertEqual(mock_reverse.call_count, 1)
+
+        # changing the urlconf invalidates the cache
+        with self.settings(ROOT_URLCONF=settings.ROOT_URLCONF):
+            self.assertTrue(
+                IsApiRequest.is_api_request(self.factory.get('/api/')))
+        self.assertEqual(mock_reverse.call_count, 2)
+
+
+class ApiBasketMiddleWareTest(APITest):
+    fixtures = [
+        'product', 'productcategory', 'productattribute', 'productclass',
+        'productattributevalue', 'category', 'attributeoptiongroup',
+        'attributeoption', 'stockrecord', 'partner'
+    ]
+
+    def basket_settings(self):
+        return self.settings(
+            MIDDLEWARE_CLASSES=tuple(
+                'oscarapi.middleware.ApiBasketMiddleWare'
+                if m == 'oscar.apps.basket.middleware.BasketMiddleware' else m
+                for m in settings.MIDDLEWARE_CLASSES
+            )
+        )
+
+    def test_basket_is_looked_up_once(self):
+        "The view and the middleware should share the basket of a request"
+        self.login('nobody', 'nobody')
+        with self.basket_settings():
+            with patch('oscarapi.basket.operations.get_user_basket',
+                       side_effect=operations.get_user_basket) as lookup, \
+                    patch('oscarapi.basket.operations.assign_basket_strategy',
+                          side_effect=operations.assign_basket_strategy) as prepare:
+                self.response = self.get('api-basket')
+                self.response.assertStatusEqual(200)
+                self.assertEqual(lookup.call_count, 1)
+                self.assertEqual(prepare.call_count, 1)
+
+    def test_basket_is_forgotten_after_login(self):
+        "A basket looked up for an anonymous user is not used after login"
+        with self.basket_settings():
+            self.response = self.get('api-basket', session_id='koe')
+            anonymous_basket_id = self.response['id']
+
+            self.response = self.post(
+                'api-login', username='nobody', password='nobody',
+                session_id='koe')
+            self.response.assertStatusEqual(200)
+
+            self.response = self.get(
+                'api-basket', session_id='koe', authenticated=True)
+            self.response.assertStatusEqual(200)
+            self.assertEqual(self.response['owner'],
+                             'http://testserver/api/users/2/')
+            self.assertNotEqual(self.response['id'], anonymous_basket_id)
+
+    def test_offers_are_applied_once(self):
+        "Offers are only applied when the prices are serialized"
+        self.login('nobody', 'nobody')
+        with self.basket_settings():
+            self.response = self.post(
+                'api-basket-add-product',
+                url="http://testserver/api/products/1/", quantity=5)
+            self.response.assertStatusEqual(200)
+
+            with patch('oscarapi.basket.operations.Applicator') as applicator:
+                self.response = self.get('api-basket')
+                self.response.assertStatusEqual(200)
+                self.assertEqual(applicator.return_value.apply.call_count, 1)
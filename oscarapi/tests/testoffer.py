@@ -1,13 +1,19 @@
 import json
+from decimal import Decimal
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from mock import patch
 
 from oscar.core.loading import get_model
 
+from oscarapi.basket import operations
 from oscarapi.tests.utils import APITest
 
 
 Basket = get_model('basket', 'Basket')
+Benefit = get_model('offer', 'Benefit')
+ConditionalOffer = get_model('offer', 'ConditionalOffer')
 
 
 class OfferTest(APITest):
@@ -77,3 +83,51 @@ class OfferTest(APITest):
         # this price should be incl discount
         self.assertEqual(self.response['price_incl_tax'], '12.00')
         self.assertEqual(self.response['price_excl_tax'], '12.00')
+
+
+class CachedOfferTest(OfferTest):
+    "Run the offer tests with the offer cache enabled"
+
+    def setUp(self):
+        cache.clear()
+        super(CachedOfferTest, self).setUp()
+
+    def run(self, *args, **kwargs):
+        with self.settings(OSCARAPI_OFFER_CACHE_TIMEOUT=300):
+            return super(CachedOfferTest, self).run(*args, **kwargs)
+
+    def test_offers_are_cached(self):
+        "The same basket content should only run the applicator once"
+        self.test_basket_discount()
+        with patch('oscarapi.basket.operations.Applicator',
+                   side_effect=operations.Applicator) as applicator:
+            self.response = self.get('api-basket')
+            self.response.assertValueEqual('total_excl_tax', "42.00")
+            self.response = self.get('api-basket')
+            self.response.assertValueEqual('total_excl_tax', "42.00")
+            self.assertFalse(applicator.called)
+
+    def test_changed_offers_are_not_cached(self):
+        "Changing an offer should make the cached discounts stale"
+        self.test_basket_discount()
+        benefit = Benefit.objects.get(pk=1)
+        benefit.value = '10.00'
+        benefit.save()
+        self.response = self.get('api-basket')
+        self.response.assertValueEqual('total_excl_tax', "40.00")
+
+    def test_recorded_usage_keeps_cached_offers(self):
+        "Counting the usage of an offer should not make the discounts stale"
+        self.test_basket_discount()
+        offer = ConditionalOffer.objects.get(pk=1)
+        offer.record_usage({'freq': 1, 'discount': Decimal('8.00')})
+        with patch('oscarapi.basket.operations.Applicator',
+                   side_effect=operations.Applicator) as applicator:
+            self.response = self.get('api-basket')
+            self.response.assertValueEqual('total_excl_tax', "42.00")
+            self.assertFalse(applicator.called)
+
+        offer.end_datetime = offer.start_datetime
+        offer.save()
+        self.response = self.get('api-basket')
+        self.response.assertValueEqual('total_excl_tax', "50.00")
@@ -1,5 +1,34 @@
+import json
+
 from oscarapi.tests.utils import APITest
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from mock import Mock, patch
+from rest_framework import renderers
+
+from oscar.core.loading import get_model
+
+from oscarapi import utils
+from oscarapi.views.basic import ProductDetail, ProductList
+
+AttributeOption = get_model('catalogue', 'AttributeOption')
+Product = get_model('catalogue', 'Product')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+
+
+class HTMLRenderer(renderers.BaseRenderer):
+    "Stands in for the browsable api, which shows who is logged in"
+    media_type = 'text/html'
+    format = 'html'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            return ''.join(
+                '<h1>%s</h1>' % item.get('title') for item in data).encode()
+        return ('<h1>%s</h1>' % data.get('title')).encode()
 
 
 class ProductTest(APITest):
@@ -43,3 +72,248 @@ class ProductTest(APITest):
         self.response = self.get(reverse('product-availability', args=(1,)))
         self.response.assertStatusEqual(200)
         self.assertIn('num_available', self.response.body)
+
+    def test_product_detail_queries(self):
+        "The number of queries of a product detail should not grow with its attributes"
+        url = reverse('product-detail', args=(1,))
+        self.response = self.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.response = self.get(url)
+            self.response.assertStatusEqual(200)
+        num_queries = len(queries)
+
+        attribute = ProductAttribute.objects.create(
+            product_class_id=1, name='Color', code='color', type='option',
+            option_group_id=1)
+        ProductAttributeValue.objects.create(
+            attribute=attribute, product_id=1, value_option_id=1)
+
+        with self.assertNumQueries(num_queries):
+            self.response = self.get(url)
+            self.response.assertStatusEqual(200)
+        self.assertEqual(len(self.response.body['attributes']), 2)
+
+    def test_product_list_cursor_pagination(self):
+        "The product list should be paginated with a cursor when configured"
+        with self.settings(OSCARAPI_CURSOR_PAGE_SIZE=1):
+            self.response = self.get('product-list')
+            self.response.assertStatusEqual(200)
+            self.assertEqual(len(self.response.body['results']), 1)
+            self.assertNotIn('count', self.response.body)
+            self.assertEqual(self.response.body['results'][0]['id'], 1)
+
+            self.response = self.get(self.response.body['next'])
+            self.response.assertStatusEqual(200)
+            self.assertEqual(len(self.response.body['results']), 1)
+            self.assertEqual(self.response.body['results'][0]['id'], 2)
+            self.assertIsNone(self.response.body['next'])
+
+    def test_product_list_stream(self):
+        "The product list should be streamed when asked for"
+        self.response = self.get('product-list')
+        products = self.response.body
+
+        with self.settings(OSCARAPI_STREAM_CHUNK_SIZE=1):
+            self.response = self.get(reverse('product-list') + '?stream=1')
+            self.response.assertStatusEqual(200)
+            self.assertTrue(self.response.streaming)
+            content = b''.join(self.response.streaming_content)
+            self.assertEqual(json.loads(content.decode('utf-8')), products)
+
+    def test_product_list_stream_json_only(self):
+        "Only json should be streamed"
+        url = reverse('product-list') + '?stream=1&format=html'
+        with patch.object(ProductList, 'renderer_classes',
+                          (renderers.JSONRenderer, HTMLRenderer)):
+            self.response = self.get(url)
+        self.response.assertStatusEqual(200)
+        self.assertFalse(self.response.streaming)
+        self.assertTrue(
+            self.response.get('Content-Type').startswith('text/html'))
+
+    def test_product_list_stream_prefetches(self):
+        "The related objects should be prefetched for each chunk"
+        view = ProductList()
+        chunks = []
+
+        def get_serializer(view, chunk, many):
+            chunks.append(chunk)
+            return Mock(data=[])
+
+        queryset = Product.objects.prefetch_related('stockrecords')
+        with self.settings(OSCARAPI_STREAM_CHUNK_SIZE=1), \
+                patch.object(ProductList, 'get_serializer', autospec=True,
+                             side_effect=get_serializer):
+            b''.join(view.stream_list(queryset))
+
+        self.assertTrue(chunks)
+        with self.assertNumQueries(0):
+            for chunk in chunks:
+                for product in chunk:
+                    list(product.stockrecords.all())
+
+    def test_product_price_availability(self):
+        "See if we get the price and availability of many products at once"
+        url = reverse('product-price-availability')
+        self.response = self.get(url + '?ids=1,2,999')
+        self.response.assertStatusEqual(200)
+        self.assertEqual([info['id'] for info in self.response.body], [1, 2])
+
+        prices = self.response.body
+        self.response = self.get(reverse('product-price', args=(1,)))
+        self.assertEqual(prices[0]['price'], self.response.body)
+        self.response = self.get(reverse('product-availability', args=(1,)))
+        self.assertEqual(prices[0]['availability'], self.response.body)
+
+        self.response = self.get(url + '?ids=1,koe')
+        self.response.assertStatusEqual(400)
+
+    def test_product_detail_conditional_get(self):
+        "An unchanged product should not be sent again"
+        url = reverse('product-detail', args=(1,))
+        self.response = self.client.get(url)
+        self.response.assertStatusEqual(200)
+        etag = self.response.get('ETag')
+        last_modified = self.response.get('Last-Modified')
+
+        self.response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.response.assertStatusEqual(304)
+        self.response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.response.assertStatusEqual(304)
+
+        Product.objects.get(pk=1).save()
+        self.response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.response.assertStatusEqual(200)
+        self.assertNotEqual(self.response.get('ETag'), etag)
+
+    def test_product_detail_conditional_get_multi_option(self):
+        "Changing the options of a multi option value should change the etag"
+        url = reverse('product-detail', args=(1,))
+        self.response = self.client.get(url)
+        etag = self.response.get('ETag')
+
+        value = ProductAttributeValue.objects.filter(product_id=1).first()
+        value.value_multi_option.add(AttributeOption.objects.get(pk=1))
+        self.response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.response.assertStatusEqual(200)
+
+    def test_product_detail_conditional_get_any_etag(self):
+        "Any etag should only match products which exist"
+        url = reverse('product-detail', args=(1,))
+        self.response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.response.assertStatusEqual(304)
+
+        url = reverse('product-detail', args=(999,))
+        self.response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.response.assertStatusEqual(404)
+
+    def test_product_detail_response_cache(self):
+        "Product details should be cached until the product changes"
+        cache.clear()
+        url = reverse('product-detail', args=(1,))
+        with self.settings(OSCARAPI_RESPONSE_CACHE_TIMEOUT=300):
+            self.response = self.get(url)
+            self.response.assertValueEqual('title', "Oscar T-shirt")
+
+            Product.objects.filter(pk=1).update(title="Koe")
+            self.response = self.get(url)
+            self.assertIn(b'Oscar T-shirt', self.response.content)
+
+            Product.objects.get(pk=1).save()
+            self.response = self.get(url)
+            self.response.assertValueEqual('title', "Koe")
+
+    def test_product_detail_response_cache_eviction(self):
+        "Losing the catalogue generation should not bring back old responses"
+        cache.clear()
+        url = reverse('product-detail', args=(1,))
+        with self.settings(OSCARAPI_RESPONSE_CACHE_TIMEOUT=300):
+            self.response = self.get(url)
+            self.response.assertValueEqual('title', "Oscar T-shirt")
+
+            Product.objects.filter(pk=1).update(title="Koe")
+            cache.delete('oscarapi.catalogue.generation')
+            self.response = self.get(url)
+            self.response.assertValueEqual('title', "Koe")
+
+    def test_product_detail_response_cache_json_only(self):
+        "Only json responses should be cached, with their headers"
+        cache.clear()
+        url = reverse('product-detail', args=(1,))
+        with self.settings(OSCARAPI_RESPONSE_CACHE_TIMEOUT=300), \
+                patch.object(ProductDetail, 'renderer_classes',
+                             (renderers.JSONRenderer, HTMLRenderer)):
+            self.response = self.client.get(url, HTTP_ACCEPT='text/html')
+            self.response.assertStatusEqual(200)
+            self.assertIn(b'Oscar T-shirt', self.response.content)
+
+            Product.objects.filter(pk=1).update(title="Koe")
+            self.response = self.client.get(url, HTTP_ACCEPT='text/html')
+            self.assertIn(b'Koe', self.response.content)
+
+            self.response = self.get(url)
+            headers = dict(self.response.response.items())
+            self.response = self.get(url)
+            self.assertIn(b'Koe', self.response.content)
+            cached_headers = dict(self.response.response.items())
+            self.assertEqual(cached_headers.get('Vary'), headers.get('Vary'))
+            self.assertEqual(cached_headers.get('Allow'), headers.get('Allow'))
+
+    def test_product_detail_fields(self):
+        "Only the fields asked for should be serialized and queried"
+        url = reverse('product-detail', args=(1,))
+        self.response = self.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.response = self.get(url)
+        num_queries = len(queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.response = self.get(url + '?fields=url,title')
+        self.response.assertStatusEqual(200)
+        self.assertEqual(set(self.response.body), set(['url', 'title']))
+        self.assertLess(len(queries), num_queries)
+
+    def test_product_detail_expand(self):
+        "Linked resources should be embedded when asked for"
+        self.response = self.get(reverse('product-price', args=(1,)))
+        price = self.response.body
+        self.response = self.get(reverse('product-availability', args=(1,)))
+        availability = self.response.body
+
+        url = reverse('product-detail', args=(1,))
+        self.response = self.get(url + '?expand=price,availability')
+        self.response.assertStatusEqual(200)
+        self.response.assertValueEqual('price', price)
+        self.response.assertValueEqual('availability', availability)
+        self.assertTrue(self.response['stockrecords'].startswith('http'))
+
+    def test_product_list_url_templates(self):
+        "Each url pattern should be reversed only once to render the links"
+        utils.clear_url_templates()
+        self.response = self.get('product-list')
+        products = self.response.body
+
+        with patch('oscarapi.utils.django_reverse',
+                   side_effect=utils.django_reverse) as django_reverse:
+            self.response = self.get('product-list')
+            self.assertEqual(self.response.body, products)
+            self.assertFalse(django_reverse.called)
+
+        utils.clear_url_templates()
+        with patch('oscarapi.utils.django_reverse',
+                   side_effect=utils.django_reverse) as django_reverse:
+            self.response = self.get('product-list')
+            self.assertEqual(self.response.body, products)
+            # once for the url and once for the template
+            self.assertEqual(django_reverse.call_count, 2)
+
+    def test_product_list_url_templates_keep_format(self):
+        "The links should keep the format of the request"
+        utils.clear_url_templates()
+        url = '%s?format=json' % reverse('product-list')
+        for _ in range(2):
+            self.response = self.get(url)
+            self.response.assertStatusEqual(200)
+            for product in self.response.body:
+                self.assertTrue(product['url'].endswith('?format=json'))
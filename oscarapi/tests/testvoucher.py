@@ -1,3 +1,7 @@
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from oscar.core.loading import get_model
@@ -56,6 +60,81 @@ class VoucherTest(APITest):
         self.response = self.get('api-basket')
         self.response.assertValueEqual('total_incl_tax', '15.00')
 
+    def test_basket_add_voucher_without_discount(self):
+        """A voucher which gives no discount should not be saved at all"""
+        self.response = self.get('api-basket')
+        self.response.assertStatusEqual(200)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.response = self.post(
+                'api-basket-add-voucher',
+                vouchercode='TESTVOUCHER')
+        self.response.assertStatusEqual(406)
+
+        writes = [query['sql'] for query in queries
+                  if 'vouchers' in query['sql'] and
+                  not query['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertFalse(Basket.objects.get().vouchers.exists())
+
+    def test_voucher_lookup_is_cached(self):
+        """Unknown voucher codes should not be looked up every time"""
+        self.response = self.post(
+            'api-basket-add-voucher', vouchercode='UNKNOWN')
+        self.response.assertStatusEqual(406)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.response = self.post(
+                'api-basket-add-voucher', vouchercode='UNKNOWN')
+        self.response.assertStatusEqual(406)
+        self.assertFalse([query for query in queries
+                          if 'voucher_voucher' in query['sql']])
+
+    def test_voucher_attempts_are_throttled(self):
+        """Trying too many vouchers should be refused"""
+        cache.clear()
+        with self.settings(OSCARAPI_VOUCHER_RATE='2/min'):
+            for i in range(2):
+                self.response = self.post(
+                    'api-basket-add-voucher', vouchercode='UNKNOWN')
+                self.response.assertStatusEqual(406)
+
+            self.response = self.post(
+                'api-basket-add-voucher', vouchercode='TESTVOUCHER')
+            self.response.assertStatusEqual(429)
+
+    def test_voucher_attempts_are_throttled_by_ip(self):
+        """A new session id should not give a new limit"""
+        cache.clear()
+        with self.settings(OSCARAPI_VOUCHER_RATE='2/min'):
+            for session_id in ('koe', 'kip'):
+                self.response = self.post(
+                    'api-basket-add-voucher', vouchercode='UNKNOWN',
+                    session_id=session_id)
+                self.response.assertStatusEqual(406)
+
+            self.response = self.post(
+                'api-basket-add-voucher', vouchercode='TESTVOUCHER',
+                session_id='paard')
+            self.response.assertStatusEqual(429)
+
+    def test_voucher_attempts_ignore_forwarded_for(self):
+        "A new X-Forwarded-For header should not give a new limit"
+        cache.clear()
+        with self.settings(OSCARAPI_VOUCHER_RATE='2/min'):
+            for address in ('10.0.0.1', '10.0.0.2'):
+                self.response = self.client.post(
+                    reverse('api-basket-add-voucher'),
+                    {'vouchercode': 'UNKNOWN'},
+                    HTTP_X_FORWARDED_FOR=address)
+                self.response.assertStatusEqual(406)
+
+            self.response = self.client.post(
+                reverse('api-basket-add-voucher'),
+                {'vouchercode': 'TESTVOUCHER'},
+                HTTP_X_FORWARDED_FOR='10.0.0.3')
+            self.response.assertStatusEqual(429)
+
     def test_lowercase_voucher(self):
         """Lowercase vouchers should be working as well"""
         # first add two products to our basket
@@ -0,0 +1,38 @@
+"Throttles for the api calls that are abused by bots"
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from oscarapi.cache import get_shared_cache
+from oscarapi.utils import overridable
+
+__all__ = ('VoucherRateThrottle',)
+
+
+class VoucherRateThrottle(SimpleRateThrottle):
+    """
+    Limit the number of vouchers a client can try to
+    ``OSCARAPI_VOUCHER_RATE``, eg. ``'10/min'``.
+
+    Clients are told apart by ip address, because clients using header
+    sessions choose their own session id, so they could get a new limit for
+    every attempt. The ``X-Forwarded-For`` header is only trusted when rest
+    framework's ``NUM_PROXIES`` is set.
+    """
+    scope = 'oscarapi.voucher'
+
+    def __init__(self):
+        self.cache = get_shared_cache()
+        super(VoucherRateThrottle, self).__init__()
+
+    def get_rate(self):
+        return overridable('OSCARAPI_VOUCHER_RATE', None)
+
+    def get_cache_key(self, request, view):
+        return '%s.ip.%s' % (self.scope, self.get_ident(request))
+
+    def get_ident(self, request):
+        # without NUM_PROXIES rest framework uses X-Forwarded-For as is, which
+        # clients could change for every attempt as well.
+        if api_settings.NUM_PROXIES is None:
+            return request.META.get('REMOTE_ADDR')
+        return super(VoucherRateThrottle, self).get_ident(request)
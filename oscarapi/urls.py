@@ -11,6 +11,7 @@ api_root = get_api_class('oscarapi.views', 'api_root')
 # basket views
 (BasketView,
  AddProductView,
+ AddProductsView,
  AddVoucherView,
  shipping_methods,
  LineList,
@@ -21,6 +22,7 @@ api_root = get_api_class('oscarapi.views', 'api_root')
                       (
                           'BasketView',
                           'AddProductView',
+                          'AddProductsView',
                           'AddVoucherView',
                           'shipping_methods',
                           'LineList',
@@ -34,6 +36,7 @@ api_root = get_api_class('oscarapi.views', 'api_root')
  ProductDetail,
  ProductPrice,
  ProductAvailability,
+ ProductPriceAvailability,
  StockRecordList,
  StockRecordDetail,
  OptionList,
@@ -55,6 +58,7 @@ api_root = get_api_class('oscarapi.views', 'api_root')
                         'ProductDetail',
                         'ProductPrice',
                         'ProductAvailability',
+                        'ProductPriceAvailability',
                         'StockRecordList',
                         'StockRecordDetail',
                         'OptionList',
@@ -92,6 +96,7 @@ urlpatterns = [
     url(r'^login/$', LoginView.as_view(), name='api-login'),
     url(r'^basket/$', BasketView.as_view(), name='api-basket'),
     url(r'^basket/add-product/$', AddProductView.as_view(), name='api-basket-add-product'),
+    url(r'^basket/add-products/$', AddProductsView.as_view(), name='api-basket-add-products'),
     url(r'^basket/add-voucher/$', AddVoucherView.as_view(), name='api-basket-add-voucher'),
     url(r'^basket/shipping-methods/$', shipping_methods, name='api-basket-shipping-methods'),
     url(r'^baskets/$', BasketList.as_view(), name='basket-list'),
@@ -103,6 +108,7 @@ urlpatterns = [
     url(r'^lineattributes/$', LineAttributeList.as_view(), name='lineattribute-list'),
     url(r'^lineattributes/(?P<pk>[0-9]+)/$', LineAttributeDetail.as_view(), name='lineattribute-detail'),
     url(r'^products/$', ProductList.as_view(), name='product-list'),
+    url(r'^products/price-availability/$', ProductPriceAvailability.as_view(), name='product-price-availability'),
     url(r'^products/(?P<pk>[0-9]+)/$', ProductDetail.as_view(), name='product-detail'),
     url(r'^products/(?P<pk>[0-9]+)/price/$', ProductPrice.as_view(), name='product-price'),
     url(r'^products/(?P<pk>[0-9]+)/availability/$', ProductAvailability.as_view(), name='product-availability'),
@@ -1,14 +1,23 @@
 import operator
 import hashlib
+import re
 from importlib import import_module
 
 from django.conf import settings
 from django.contrib import auth
+from django.contrib.sessions.backends.base import CreateError
 from rest_framework import serializers, exceptions
-from django.core.urlresolvers import NoReverseMatch
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.urlresolvers import (
+    NoReverseMatch,
+    get_script_prefix,
+    get_urlconf,
+    reverse as django_reverse
+)
+from django.utils.encoding import force_text
 
 from rest_framework import serializers, exceptions, relations
-from rest_framework.reverse import reverse
+from rest_framework.reverse import preserve_builtin_query_params, reverse
 
 from oscar.core.loading import get_class
 import oscar.models.fields
@@ -23,6 +32,35 @@ def overridable(name, default):
     return getattr(settings, name, default)
 
 
+def _get_query_list(request, name):
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+
+    query_params = getattr(request, 'query_params', request.GET)
+    values = query_params.get(name, '')
+    requested = set(value.strip() for value in values.split(','))
+    requested.discard('')
+    return requested or None
+
+
+def get_requested_fields(request):
+    """
+    Return the names of the fields asked for with the ``fields`` query
+    parameter of a GET request, eg. ``?fields=url,title``, or None when all
+    fields should be serialized.
+    """
+    return _get_query_list(request, 'fields')
+
+
+def get_requested_expansions(request):
+    """
+    Return the names of the linked fields which should be embedded in the
+    response, as asked for with the ``expand`` query parameter of a GET
+    request, eg. ``?expand=lines``.
+    """
+    return _get_query_list(request, 'expand') or set()
+
+
 def expand_field_mapping(extra_fields):
     # This doesn't make a copy
     field_mapping = serializers.ModelSerializer.serializer_field_mapping
@@ -38,16 +76,59 @@ class OscarSerializer(object):
     def __init__(self, *args, **kwargs):
         """
         Allow the serializer to be initiated with only a subset of the
-        speccified fields
+        speccified fields, either by passing ``fields`` or with the ``fields``
+        query parameter of the request. Pass empty ``fields`` to serialize all
+        fields regardless of the request.
         """
         fields = kwargs.pop('fields', None)
         super(OscarSerializer, self).__init__(*args, **kwargs)
+        if fields is None:
+            fields = get_requested_fields(self.context.get('request'))
         if fields:
             allowed = set(fields)
             existing = set(self.fields.keys())
             for field_name in existing - allowed:
                 self.fields.pop(field_name)
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None, expand=()):
+        """
+        Apply the ``select_related`` and ``prefetch_related`` declared on the
+        Meta of the serializer to ``queryset``, so the related objects of the
+        serialized fields are not fetched one query at a time.
+
+        Both are dicts mapping the name of a field to the lookups it needs,
+        the lookups of fields which are not serialized are left out. The
+        lookups in ``expand_prefetch_related`` are only applied when the
+        field is in ``expand``.
+        """
+        meta = getattr(cls, 'Meta', None)
+        declared_fields = getattr(meta, 'fields', None)
+        if isinstance(declared_fields, (list, tuple)):
+            if fields is None:
+                fields = declared_fields
+            else:
+                fields = set(fields).intersection(declared_fields)
+
+        def lookups(plan, only=None):
+            return [
+                lookup
+                for field_name, field_lookups in plan.items()
+                if fields is None or field_name in fields
+                if only is None or field_name in only
+                for lookup in field_lookups
+            ]
+
+        select_related = lookups(getattr(meta, 'select_related', {}))
+        prefetch_related = lookups(getattr(meta, 'prefetch_related', {}))
+        prefetch_related += lookups(
+            getattr(meta, 'expand_prefetch_related', {}), only=expand)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
     def to_native(self, obj):
         num_fields = len(self.get_fields())
         native = super(OscarSerializer, self).to_native(obj)
@@ -59,6 +140,112 @@ class OscarSerializer(object):
         return native
 
 
+_url_templates = {}
+
+_SIMPLE_URL_VALUE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def _make_url_template(view_name, values, url):
+    """
+    Reverse the url of ``view_name`` with placeholder values and turn the
+    placeholders into string formatting fields. Returns None when the url can
+    not be made by string formatting, for example because the pattern does
+    not accept the placeholders.
+    """
+    placeholders = {}
+    for index, (key, value) in enumerate(sorted(values.items())):
+        if value.isdigit():
+            placeholders[key] = str(9000000000 + index)
+        elif value.isalpha():
+            placeholders[key] = 'zqx' + 'abcdefghijklmnopqrstuvwxyz'[index]
+        else:
+            return None
+
+    try:
+        template = django_reverse(view_name, kwargs=placeholders)
+    except NoReverseMatch:
+        return None
+
+    template = template.replace('%', '%%')
+    for key, placeholder in placeholders.items():
+        template = template.replace(placeholder, '%%(%s)s' % key)
+
+    # make sure the placeholders did not show up anywhere else.
+    if template % values != url:
+        return None
+    return template
+
+
+def cached_reverse(viewname, args=None, kwargs=None, request=None,
+                   format=None, **extra):
+    """
+    Rest framework's ``reverse``, but each url pattern is only reversed once
+    per set of keyword arguments, after that the url is made by string
+    formatting.
+    """
+    if args or extra or not kwargs or \
+            getattr(request, 'versioning_scheme', None) is not None:
+        return reverse(viewname, args=args, kwargs=kwargs, request=request,
+                       format=format, **extra)
+
+    if format:
+        kwargs = dict(kwargs, format=format)
+    values = dict((key, force_text(value)) for key, value in kwargs.items())
+    if not all(_SIMPLE_URL_VALUE.match(value) for value in values.values()):
+        return reverse(viewname, kwargs=kwargs, request=request)
+
+    cache_key = (get_urlconf(), get_script_prefix(), viewname,
+                 tuple(sorted(values)))
+    template = _url_templates.get(cache_key, False)
+    if template is False:
+        url = django_reverse(viewname, kwargs=values)
+        template = _url_templates[cache_key] = _make_url_template(
+            viewname, values, url)
+    elif template is None:
+        url = django_reverse(viewname, kwargs=values)
+    else:
+        url = template % values
+
+    if request is not None:
+        # like rest framework's reverse, keep eg. ?format=json in the links.
+        return preserve_builtin_query_params(
+            request.build_absolute_uri(url), request)
+    return url
+
+
+def clear_url_templates():
+    "Forget the url templates, eg. when the urlconf changed."
+    _url_templates.clear()
+
+
+class HyperlinkedRelatedField(relations.HyperlinkedRelatedField):
+    "A ``HyperlinkedRelatedField`` which reverses urls with ``cached_reverse``"
+    def __init__(self, *args, **kwargs):
+        super(HyperlinkedRelatedField, self).__init__(*args, **kwargs)
+        self.reverse = cached_reverse
+
+
+class HyperlinkedPrimaryKeyField(HyperlinkedRelatedField):
+    """
+    A ``HyperlinkedRelatedField`` which resolves urls to the primary key of
+    the linked object, without loading it. Use it when many objects are
+    posted, so they can be loaded with a single query.
+    """
+    def get_object(self, view_name, view_args, view_kwargs):
+        lookup_value = view_kwargs[self.lookup_url_kwarg]
+        try:
+            return self.get_queryset().model._meta.pk.to_python(lookup_value)
+        except DjangoValidationError:
+            raise ValueError(lookup_value)
+
+
+class HyperlinkedIdentityField(relations.HyperlinkedIdentityField):
+    "A ``HyperlinkedIdentityField`` which reverses urls with ``cached_reverse``"
+    def __init__(self, *args, **kwargs):
+        super(HyperlinkedIdentityField, self).__init__(*args, **kwargs)
+        self.reverse = cached_reverse
+
+
 class OscarModelSerializer(OscarSerializer, serializers.ModelSerializer):
     """
     Correctly map oscar fields to serializer fields.
@@ -70,9 +257,28 @@ class OscarHyperlinkedModelSerializer(
     """
     Correctly map oscar fields to serializer fields.
     """
+    serializer_related_field = HyperlinkedRelatedField
+    serializer_url_field = HyperlinkedIdentityField
+
+
+class ExpandableHyperlinkedIdentityField(HyperlinkedIdentityField):
+    """
+    Links to a resource, or embeds it when the name of the field is passed
+    with the ``expand`` query parameter, eg. ``?expand=lines``.
+
+    The embedded representation is made by the ``expand_<field_name>`` method
+    of the serializer, which is passed the object being serialized.
+    """
+    def to_representation(self, value):
+        request = self.context.get('request')
+        if self.field_name in get_requested_expansions(request):
+            expand = getattr(self.parent, 'expand_%s' % self.field_name)
+            return expand(value)
+        return super(
+            ExpandableHyperlinkedIdentityField, self).to_representation(value)
 
 
-class DrillDownHyperlinkedIdentityField(relations.HyperlinkedIdentityField):
+class DrillDownHyperlinkedIdentityField(HyperlinkedIdentityField):
     def __init__(self, *args, **kwargs):
         try:
             self.extra_url_kwargs = kwargs.pop('extra_url_kwargs')
@@ -103,7 +309,7 @@ class DrillDownHyperlinkedIdentityField(relations.HyperlinkedIdentityField):
             return None
 
         try:
-            return reverse(view_name, kwargs=kwargs, request=request, format=format)
+            return self.reverse(view_name, kwargs=kwargs, request=request, format=format)
         except NoReverseMatch:
             pass
 
@@ -113,7 +319,7 @@ class DrillDownHyperlinkedIdentityField(relations.HyperlinkedIdentityField):
             kwargs = {self.pk_url_kwarg: obj.pk}
             kwargs.update(self.get_extra_url_kwargs(obj))
             try:
-                return reverse(view_name, kwargs=kwargs, request=request, format=format)
+                return self.reverse(view_name, kwargs=kwargs, request=request, format=format)
             except NoReverseMatch:
                 pass
 
@@ -123,13 +329,30 @@ class DrillDownHyperlinkedIdentityField(relations.HyperlinkedIdentityField):
             kwargs = {self.slug_url_kwarg: slug}
             kwargs.update(self.get_extra_url_kwargs(obj))
             try:
-                return reverse(view_name, kwargs=kwargs, request=request, format=format)
+                return self.reverse(view_name, kwargs=kwargs, request=request, format=format)
             except NoReverseMatch:
                 pass
 
         raise NoReverseMatch()
 
 
+def get_strategy(request):
+    """
+    Return the strategy of the request.
+
+    The strategy is usually assigned by oscar's basket middleware, otherwise
+    it is made once and kept on the request, so the strategy isn't built
+    again for every product or basket.
+    """
+    strategy = getattr(request, 'strategy', None)
+    if strategy is None:
+        strategy = Selector().strategy(request=request, user=request.user)
+        # rest framework wraps the django request, keep the strategy on the
+        # django request so it is shared with the middleware.
+        getattr(request, '_request', request).strategy = strategy
+    return strategy
+
+
 def get_domain(request):
     return request.get_host().split(':')[0]
 
@@ -176,20 +399,25 @@ def get_session(session_id, raise_on_create=False):
     engine = import_module(settings.SESSION_ENGINE)
     session = engine.SessionStore(session_id)
 
-    if not session.exists(session_id):
+    # Loading the session is the only round-trip needed to find out if it
+    # exists, so keep the loaded data to avoid loading it again later.
+    # When the session is missing or has expired, django will have replaced
+    # the session key.
+    session._session_cache = session.load()
+    if session.session_key != session_id:
         if raise_on_create:
             raise exceptions.NotAuthenticated()
-        else:
-            session.save(must_create=True)
-    else:
-        # if we get an expired session from django,
-        # the session key will change after calling load.
+
         # since the whole point of get_session is to retrieve a session
-        # with axactly the key specified, we have to clear the expired
-        # sessions and then get a new session.
-        session.load()
-        if session.session_key != session_id:
-            engine.SessionStore.clear_expired()
-            session = get_session(session_id, raise_on_create)
+        # with exactly the key specified, start a new session with that key.
+        # An expired session stored with the same key is overwritten, so
+        # there is no need to clear expired sessions here, that is left to
+        # the clearsessions management command.
+        session._session_key = session_id
+        session._session_cache = {}
+        try:
+            session.save(must_create=True)
+        except CreateError:
+            session.save()
 
     return session
@@ -1,26 +1,34 @@
-import functools
 import itertools
-from six.moves import map
 
 from django.contrib import auth
-from oscar.core.loading import get_model, get_class
-from rest_framework import generics
+from oscar.core.loading import get_model
+from rest_framework import exceptions, generics
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
-from .mixin import PutIsPatchMixin
+from .mixin import (
+    ConditionalGetMixin,
+    CursorPaginationMixin,
+    EagerLoadingMixin,
+    PutIsPatchMixin,
+    ResponseCacheMixin,
+    StreamingListMixin
+)
 from oscarapi import permissions
-from oscarapi.basket.operations import assign_basket_strategy
+from oscarapi.basket.operations import (
+    assign_basket_strategy,
+    assign_baskets_strategy
+)
+from oscarapi.cache import STOCKRECORD_CACHE_PREFIX
 from oscarapi.loading import get_api_class, get_api_classes
+from oscarapi.utils import get_strategy, overridable
 
 
-Selector = get_class('partner.strategy', 'Selector')
-
 __all__ = (
     'BasketList', 'BasketDetail',
     'LineAttributeList', 'LineAttributeDetail',
     'ProductList', 'ProductDetail',
-    'ProductPrice', 'ProductAvailability',
+    'ProductPrice', 'ProductAvailability', 'ProductPriceAvailability',
     'StockRecordList', 'StockRecordDetail',
     'UserList', 'UserDetail',
     'OptionList', 'OptionDetail',
@@ -39,12 +47,14 @@ Partner = get_model('partner', 'Partner')
 
 # checkout serializers
 (CountrySerializer,
- PriceSerializer
+ PriceSerializer,
+ PurchaseInfoSerializer
  ) \
     = get_api_classes('oscarapi.serializers.checkout',
                       (
                           'CountrySerializer',
-                          'PriceSerializer'
+                          'PriceSerializer',
+                          'PurchaseInfoSerializer'
                       ))
 
 # basket serializers
@@ -80,29 +90,45 @@ UserSerializer = get_api_class('oscarapi.serializers.login', 'UserSerializer')
 
 # TODO: For all API's in this file, the permissions should be checked if they
 # are sensible.
-class CountryList(generics.ListAPIView):
+class CountryList(ConditionalGetMixin, ResponseCacheMixin, EagerLoadingMixin,
+                  generics.ListAPIView):
     serializer_class = CountrySerializer
     queryset = Country.objects.all()
 
 
-class CountryDetail(generics.RetrieveAPIView):
+class CountryDetail(ConditionalGetMixin, EagerLoadingMixin,
+                    generics.RetrieveAPIView):
     serializer_class = CountrySerializer
     queryset = Country.objects.all()
 
 
-class BasketList(generics.ListCreateAPIView):
+class BasketList(EagerLoadingMixin, generics.ListCreateAPIView):
     serializer_class = BasketSerializer
     queryset = Basket.objects.all()
     permission_classes = (IsAdminUser,)
 
     def get_queryset(self):
         qs = super(BasketList, self).get_queryset()
-        return map(
-            functools.partial(assign_basket_strategy, request=self.request),
-            qs)
-
-
-class BasketDetail(PutIsPatchMixin, generics.RetrieveUpdateDestroyAPIView):
+        return qs.prefetch_related('vouchers__offers')
+
+    def list(self, request, *args, **kwargs):
+        """
+        Only prepare the baskets on the current page, sharing one strategy
+        between them.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        baskets = assign_baskets_strategy(
+            list(queryset) if page is None else page, request)
+
+        serializer = self.get_serializer(baskets, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+
+class BasketDetail(EagerLoadingMixin, PutIsPatchMixin,
+                   generics.RetrieveUpdateDestroyAPIView):
     serializer_class = BasketSerializer
     permission_classes = (permissions.IsAdminUserOrRequestContainsBasket,)
     queryset = Basket.objects.all()
@@ -112,22 +138,25 @@ class BasketDetail(PutIsPatchMixin, generics.RetrieveUpdateDestroyAPIView):
         return assign_basket_strategy(basket, self.request)
 
 
-class LineAttributeList(generics.ListCreateAPIView):
+class LineAttributeList(EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = LineAttribute.objects.all()
     serializer_class = LineAttributeSerializer
 
 
-class LineAttributeDetail(generics.RetrieveAPIView):
+class LineAttributeDetail(EagerLoadingMixin, generics.RetrieveAPIView):
     queryset = LineAttribute.objects.all()
     serializer_class = LineAttributeSerializer
 
 
-class ProductList(generics.ListAPIView):
+class ProductList(ConditionalGetMixin, ResponseCacheMixin, StreamingListMixin,
+                  CursorPaginationMixin, EagerLoadingMixin,
+                  generics.ListAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductLinkSerializer
 
 
-class ProductDetail(generics.RetrieveAPIView):
+class ProductDetail(ConditionalGetMixin, ResponseCacheMixin, EagerLoadingMixin,
+                    generics.RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
@@ -136,7 +165,7 @@ class ProductPrice(generics.RetrieveAPIView):
 
     def get(self, request, pk=None, format=None):
         product = Product.objects.get(id=pk)
-        strategy = Selector().strategy(request=request, user=request.user)
+        strategy = get_strategy(request)
         ser = PriceSerializer(
             strategy.fetch_for_product(product).price,
             context={'request': request})
@@ -149,14 +178,63 @@ class ProductAvailability(generics.RetrieveAPIView):
 
     def get(self, request, pk=None, format=None):
         product = Product.objects.get(id=pk)
-        strategy = Selector().strategy(request=request, user=request.user)
+        strategy = get_strategy(request)
         ser = AvailabilitySerializer(
             strategy.fetch_for_product(product).availability,
             context={'request': request})
         return Response(ser.data)
 
 
-class StockRecordList(generics.ListAPIView):
+class ProductPriceAvailability(generics.GenericAPIView):
+    """
+    The prices and availability of many products at once.
+
+    GET(ids):
+    The price and availability of each of the products with the ids passed
+    as a comma separated list, eg. ``?ids=1,2,3``. Unknown products are left
+    out.
+    """
+    serializer_class = PurchaseInfoSerializer
+
+    def get_product_ids(self, request):
+        ids = request.query_params.get('ids', '')
+        try:
+            product_ids = set(int(pk) for pk in ids.split(',') if pk)
+        except ValueError:
+            raise exceptions.ValidationError({'ids': 'Invalid product id'})
+
+        max_products = overridable('OSCARAPI_MAX_PRICE_AVAILABILITY_PRODUCTS',
+                                   100)
+        if len(product_ids) > max_products:
+            raise exceptions.ValidationError(
+                {'ids': 'At most %d products are allowed' % max_products})
+        return product_ids
+
+    def get(self, request, format=None):
+        products = Product.objects.filter(
+            id__in=self.get_product_ids(request)
+        ).select_related(
+            'product_class', 'parent__product_class'
+        ).prefetch_related(
+            'stockrecords', 'children__stockrecords'
+        ).order_by('id')
+
+        strategy = get_strategy(request)
+        purchase_infos = []
+        for product in products:
+            info = strategy.fetch_for_product(product)
+            purchase_infos.append({
+                'product': product,
+                'price': info.price,
+                'availability': info.availability,
+            })
+
+        ser = self.get_serializer(purchase_infos, many=True)
+        return Response(ser.data)
+
+
+class StockRecordList(StreamingListMixin, CursorPaginationMixin,
+                      EagerLoadingMixin, generics.ListAPIView):
     serializer_class = StockRecordSerializer
     queryset = StockRecord.objects.all()
 
@@ -167,38 +245,45 @@ class StockRecordList(generics.ListAPIView):
         return super(StockRecordList, self).get(request, *args, **kwargs)
 
 
-class StockRecordDetail(generics.RetrieveAPIView):
+class StockRecordDetail(ResponseCacheMixin, EagerLoadingMixin,
+                        generics.RetrieveAPIView):
     queryset = StockRecord.objects.all()
     serializer_class = StockRecordSerializer
+    response_cache_groups = (STOCKRECORD_CACHE_PREFIX,)
 
 
-class UserList(generics.ListAPIView):
+class UserList(CursorPaginationMixin, EagerLoadingMixin,
+               generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (IsAdminUser,)
 
 
-class UserDetail(generics.RetrieveAPIView):
+class UserDetail(EagerLoadingMixin, generics.RetrieveAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (IsAdminUser,)
 
 
-class OptionList(generics.ListAPIView):
+class OptionList(ConditionalGetMixin, ResponseCacheMixin, EagerLoadingMixin,
+                 generics.ListAPIView):
     queryset = Option.objects.all()
     serializer_class = OptionSerializer
 
 
-class OptionDetail(generics.RetrieveAPIView):
+class OptionDetail(ConditionalGetMixin, EagerLoadingMixin,
+                   generics.RetrieveAPIView):
     queryset = Option.objects.all()
     serializer_class = OptionSerializer
 
 
-class PartnerList(generics.ListAPIView):
+class PartnerList(ConditionalGetMixin, CursorPaginationMixin,
+                  EagerLoadingMixin, generics.ListAPIView):
     queryset = Partner.objects.all()
     serializer_class = PartnerSerializer
 
 
-class PartnerDetail(generics.RetrieveAPIView):
+class PartnerDetail(ConditionalGetMixin, EagerLoadingMixin,
+                    generics.RetrieveAPIView):
     queryset = Partner.objects.all()
     serializer_class = PartnerSerializer
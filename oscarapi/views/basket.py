@@ -1,8 +1,9 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
 
 from oscar.apps.basket import signals
-from oscar.core.loading import get_model, get_class
+from oscar.core.loading import get_model
 
 from rest_framework import status, generics, exceptions
 from rest_framework.decorators import api_view
@@ -11,16 +12,19 @@ from rest_framework.views import APIView
 
 from oscarapi import permissions
 from oscarapi.basket import operations
-from oscarapi.views.mixin import PutIsPatchMixin
+from oscarapi.views.mixin import PutIsPatchMixin, StreamingListMixin
 from oscarapi.views.utils import BasketPermissionMixin
 from oscarapi.loading import get_api_class, get_api_classes
+from oscarapi.throttling import VoucherRateThrottle
+from oscarapi.utils import overridable
 
 __all__ = ('BasketView', 'LineList', 'LineDetail', 'AddProductView',
+           'AddProductsView',
            'BasketLineDetail', 'AddVoucherView', 'shipping_methods')
 
 Basket = get_model('basket', 'Basket')
 Line = get_model('basket', 'Line')
-Repository = get_class('shipping.repository', 'Repository')
+Product = get_model('catalogue', 'Product')
 
 # basket serializers
 (BasketSerializer,
@@ -42,12 +46,14 @@ Repository = get_class('shipping.repository', 'Repository')
 
 # product serializers
 (ProductSerializer,
- AddProductSerializer
+ AddProductSerializer,
+ AddProductsSerializer
  ) \
     = get_api_classes('oscarapi.serializers.product',
                       (
                           'ProductSerializer',
-                          'AddProductSerializer'
+                          'AddProductSerializer',
+                          'AddProductsSerializer'
                       ))
 
 ShippingMethodSerializer = get_api_class('oscarapi.serializers.checkout', 'ShippingMethodSerializer')
@@ -137,6 +143,109 @@ class AddProductView(APIView):
             {'reason': p_ser.errors}, status=status.HTTP_406_NOT_ACCEPTABLE)
 
 
+class AddProductsView(AddProductView):
+    """
+    Add many products to the basket at once.
+
+    POST([{url, quantity, options}, ...])
+    [
+        {
+            "url": "http://testserver.org/oscarapi/products/209/",
+            "quantity": 6
+        },
+        {
+            "url": "http://testserver.org/oscarapi/products/210/",
+            "quantity": 1,
+            "options": [{
+                "option": "http://testserver.org/oscarapi/options/1/",
+                "value": "some value"
+            }]
+        }
+    ]
+
+    Either all products are added or none of them are. When a product can
+    not be added, the reasons are returned as a list with an entry for each
+    of the posted products, which is null for the products that are fine.
+    """
+    add_product_serializer_class = AddProductsSerializer
+
+    def get_products(self, product_ids):
+        "Load the products with everything the strategy needs to price them"
+        return Product.objects.select_related(
+            'product_class', 'parent__product_class'
+        ).prefetch_related(
+            'stockrecords', 'children__stockrecords'
+        ).in_bulk(set(product_ids))
+
+    def post(self, request, format=None):
+        max_products = overridable('OSCARAPI_MAX_BASKET_ADD_PRODUCTS', 100)
+        if not isinstance(request.data, list):
+            return Response(
+                {'reason': _("Expected a list of products")},
+                status=status.HTTP_406_NOT_ACCEPTABLE)
+        if len(request.data) > max_products:
+            return Response(
+                {'reason': _("At most %d products can be added at once")
+                    % max_products},
+                status=status.HTTP_406_NOT_ACCEPTABLE)
+
+        p_ser = self.add_product_serializer_class(
+            data=request.data, many=True, context={'request': request})
+        if not p_ser.is_valid():
+            # the serializer marks the valid products with an empty dict.
+            return Response(
+                {'reason': [errors or None for errors in p_ser.errors]},
+                status=status.HTTP_406_NOT_ACCEPTABLE)
+
+        basket = operations.get_basket(request)
+        items = p_ser.validated_data
+        products = self.get_products(item['url'] for item in items)
+        if len(products) < len(set(item['url'] for item in items)):
+            does_not_exist = \
+                p_ser.child.fields['url'].error_messages['does_not_exist']
+            return Response(
+                {'reason': [
+                    None if item['url'] in products
+                    else {'url': [does_not_exist]}
+                    for item in items
+                ]},
+                status=status.HTTP_406_NOT_ACCEPTABLE)
+
+        # the limits apply to the quantities of all posted lines together.
+        quantities = {}
+        for item in items:
+            product_id = item['url']
+            quantities[product_id] = \
+                quantities.get(product_id, 0) + item['quantity']
+
+        reasons = []
+        for item in items:
+            product = products[item['url']]
+            basket_valid, message = self.validate(
+                basket, product, quantities[product.id],
+                item.get('options', []))
+            reasons.append(None if basket_valid else message)
+
+        allowed, message = basket.is_quantity_allowed(
+            sum(quantities.values()))
+        if not allowed:
+            reasons = [reason or message for reason in reasons]
+
+        if any(reasons):
+            return Response(
+                {'reason': reasons}, status=status.HTTP_406_NOT_ACCEPTABLE)
+
+        with transaction.atomic():
+            for item in items:
+                basket.add_product(
+                    products[item['url']], quantity=item['quantity'],
+                    options=item.get('options', []))
+
+        operations.apply_offers(request, basket)
+        ser = self.serializer_class(basket, context={'request': request})
+        return Response(ser.data)
+
+
 class AddVoucherView(APIView):
     """
     Add a voucher to the basket.
@@ -147,10 +256,12 @@ class AddVoucherView(APIView):
     }
 
     Will return 200 and the voucher as json if succesful.
-    If unsuccessful, will return 406 with the error.
+    If unsuccessful, will return 406 with the error, or 429 when too many
+    vouchers were tried (see ``OSCARAPI_VOUCHER_RATE``).
     """
     add_voucher_serializer_class = VoucherAddSerializer
     serializer_class = VoucherSerializer
+    throttle_classes = (VoucherRateThrottle,)
 
     def post(self, request, format=None):
         v_ser = self.add_voucher_serializer_class(
@@ -159,26 +270,21 @@ class AddVoucherView(APIView):
             basket = operations.get_basket(request)
 
             voucher = v_ser.instance
-            basket.vouchers.add(voucher)
 
-            signals.voucher_addition.send(
-                sender=None, basket=basket, voucher=voucher)
-
-            # Recalculate discounts to see if the voucher gives any
-            operations.apply_offers(request, basket)
-            discounts_after = basket.offer_applications
-
-            # Look for discounts from this new voucher
-            for discount in discounts_after:
-                if discount['voucher'] and discount['voucher'] == voucher:
-                    break
-            else:
-                basket.vouchers.remove(voucher)
+            # Check the discounts of the voucher before saving anything, most
+            # of the vouchers tried don't give any.
+            if not operations.voucher_gives_discount(
+                    request, basket, voucher):
                 return Response(
                     {'reason': _(
                         "Your basket does not qualify for a voucher discount")},  # noqa
                     status=status.HTTP_406_NOT_ACCEPTABLE)
 
+            basket.vouchers.add(voucher)
+
+            signals.voucher_addition.send(
+                sender=None, basket=basket, voucher=voucher)
+
             ser = self.serializer_class(
                 voucher, context={'request': request})
             return Response(ser.data)
@@ -195,15 +301,15 @@ def shipping_methods(request, format=None):
     A list of shipping method details and the prices.
     """
     basket = operations.get_basket(request)
-    shiping_methods = Repository().get_shipping_methods(
-        basket=request.basket, user=request.user,
-        request=request)
+    quotes = operations.get_shipping_quotes(request, basket)
     ser = ShippingMethodSerializer(
-        shiping_methods, many=True, context={'basket': basket})
+        [method for method, charge in quotes], many=True,
+        context={'basket': basket, 'shipping_quotes': quotes})
     return Response(ser.data)
 
 
-class LineList(BasketPermissionMixin, generics.ListCreateAPIView):
+class LineList(StreamingListMixin, BasketPermissionMixin,
+               generics.ListCreateAPIView):
     """
     Api for adding lines to a basket.
 
@@ -2,7 +2,9 @@ from rest_framework import status, views, response, generics
 
 from oscar.core.loading import get_model
 
+from oscarapi.basket.operations import clear_request_basket
 from oscarapi.permissions import IsOwner
+from oscarapi.views.mixin import CursorPaginationMixin, EagerLoadingMixin
 from oscarapi.views.utils import BasketPermissionMixin
 from oscarapi.loading import get_api_classes
 from oscarapi.signals import oscarapi_post_checkout
@@ -32,16 +34,18 @@ __all__ = (
                       ))
 
 
-class OrderList(generics.ListAPIView):
+class OrderList(CursorPaginationMixin, EagerLoadingMixin,
+                generics.ListAPIView):
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = (IsOwner,)
 
     def get_queryset(self):
-        qs = Order.objects.all()
+        qs = super(OrderList, self).get_queryset()
         return qs.filter(user=self.request.user)
 
 
-class OrderDetail(generics.RetrieveAPIView):
+class OrderDetail(EagerLoadingMixin, generics.RetrieveAPIView):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = (IsOwner,)
@@ -128,10 +132,12 @@ class CheckoutView(BasketPermissionMixin, views.APIView):
         assert(data_basket == basket)
 
         c_ser = self.serializer_class(
-            data=request.data, context={'request': request})
+            data=request.data, context={'request': request, 'basket': basket})
         if c_ser.is_valid():
             order = c_ser.save()
             basket.freeze()
+            # the frozen basket can not be the basket of this request anymore
+            clear_request_basket(request)
             o_ser = self.order_serializer_class(
                 order, context={'request': request})
             oscarapi_post_checkout.send(
@@ -110,6 +110,7 @@ class LoginView(APIView):
             basket = operations.get_anonymous_basket(request)
             if basket:
                 operations.flush_and_delete_basket(basket)
+                operations.clear_request_basket(request)
 
         request.session.clear()
         request.session.delete()
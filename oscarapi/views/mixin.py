@@ -1,3 +1,222 @@
+import itertools
+
+import django
+from django.db.models.query import prefetch_related_objects
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import (
+    http_date,
+    parse_etags,
+    parse_http_date_safe,
+    quote_etag
+)
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from oscarapi.cache import (
+    CATALOGUE_CACHE_PREFIX,
+    get_catalogue_version,
+    get_shared_cache,
+    get_version,
+    hashed_cache_key
+)
+from oscarapi.pagination import CursorPagination
+from oscarapi.utils import (
+    get_requested_expansions,
+    get_requested_fields,
+    overridable
+)
+
+
 class PutIsPatchMixin(object):
     def put(self, request, *args, **kwargs):
         return self.partial_update(request, *args, **kwargs)
+
+
+class EagerLoadingMixin(object):
+    """
+    Let the serializer eager load the related objects it needs.
+    """
+    def get_queryset(self):
+        queryset = super(EagerLoadingMixin, self).get_queryset()
+        setup_eager_loading = getattr(
+            self.get_serializer_class(), 'setup_eager_loading', None)
+        if setup_eager_loading is not None:
+            queryset = setup_eager_loading(
+                queryset, fields=get_requested_fields(self.request),
+                expand=get_requested_expansions(self.request))
+        return queryset
+
+
+class CursorPaginationMixin(object):
+    """
+    Paginate the list with ``oscarapi.pagination.CursorPagination`` when
+    ``OSCARAPI_CURSOR_PAGE_SIZE`` is set.
+    """
+    @property
+    def pagination_class(self):
+        if overridable('OSCARAPI_CURSOR_PAGE_SIZE', None):
+            return CursorPagination
+        return super(CursorPaginationMixin, self).pagination_class
+
+
+class StreamingListMixin(object):
+    """
+    Stream the list as json when the ``stream`` query parameter is passed,
+    eg. ``/api/products/?stream=1``. Other formats, like the browsable api,
+    are never streamed.
+
+    The rows are fetched with ``QuerySet.iterator`` and serialized in chunks
+    of ``OSCARAPI_STREAM_CHUNK_SIZE``, so the memory used does not grow with
+    the length of the list. ``iterator`` ignores ``prefetch_related``, so the
+    related objects are prefetched for each chunk instead. The list is not
+    paginated when streamed.
+    """
+    def list(self, request, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        if not request.query_params.get('stream') or \
+                not isinstance(renderer, JSONRenderer):
+            return super(StreamingListMixin, self).list(
+                request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            self.stream_list(queryset), content_type='application/json')
+
+    def stream_list(self, queryset):
+        renderer = JSONRenderer()
+        chunk_size = overridable('OSCARAPI_STREAM_CHUNK_SIZE', 500)
+        prefetch_lookups = getattr(queryset, '_prefetch_related_lookups', ())
+        if hasattr(queryset, 'iterator'):
+            rows = queryset.iterator()
+        else:
+            rows = iter(queryset)
+
+        yield b'['
+        separator = b''
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            if prefetch_lookups:
+                if django.VERSION[:2] < (1, 10):
+                    prefetch_related_objects(chunk, prefetch_lookups)
+                else:
+                    prefetch_related_objects(chunk, *prefetch_lookups)
+            for item in self.get_serializer(chunk, many=True).data:
+                yield separator + renderer.render(item)
+                separator = b','
+        yield b']'
+
+
+class ConditionalGetMixin(object):
+    """
+    Answer GET requests with 304 Not Modified when the client already has
+    the current response.
+
+    The ETag and Last-Modified headers are derived from the version of the
+    catalogue, which changes whenever a product, option, partner or country
+    changes, so a request can be revalidated without touching the database.
+    """
+    def get_etag(self, request, catalogue_generation):
+        return hashed_cache_key('oscarapi.etag', repr((
+            catalogue_generation,
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT'),
+        )))
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            # django 1.11 keeps the quotes of the parsed etags, older
+            # versions strip them.
+            etags = parse_etags(if_none_match)
+            return etag in etags or quote_etag(etag) in etags
+
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        return if_modified_since is not None and \
+            if_modified_since >= last_modified
+
+    def get(self, request, *args, **kwargs):
+        # expanded prices and stock depend on more than the catalogue.
+        if get_requested_expansions(request):
+            return super(ConditionalGetMixin, self).get(
+                request, *args, **kwargs)
+
+        generation, last_modified = get_catalogue_version()
+        etag = self.get_etag(request, generation)
+
+        if self.is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super(ConditionalGetMixin, self).get(
+                request, *args, **kwargs)
+            # "*" matches any etag, but only when there is an object.
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+            if response.status_code == 200 and \
+                    '*' in parse_etags(if_none_match):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = quote_etag(etag)
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ResponseCacheMixin(object):
+    """
+    Keep the responses to GET requests in the ``OSCARAPI_CACHE`` cache for
+    ``OSCARAPI_RESPONSE_CACHE_TIMEOUT`` seconds.
+
+    The responses are cached by url, accepted content type and language, and
+    become stale when the generation of any of the ``response_cache_groups``
+    is bumped.
+    """
+    response_cache_groups = (CATALOGUE_CACHE_PREFIX,)
+
+    def get_response_cache_key(self, request):
+        generations = [
+            get_version(name)[0] for name in self.response_cache_groups]
+        return hashed_cache_key('oscarapi.response', repr((
+            generations,
+            request.build_absolute_uri(),
+            request.META.get('HTTP_ACCEPT'),
+            request.META.get('HTTP_ACCEPT_LANGUAGE'),
+        )))
+
+    def get(self, request, *args, **kwargs):
+        timeout = overridable('OSCARAPI_RESPONSE_CACHE_TIMEOUT', 0)
+        # only json is cached, the browsable api shows the user and a csrf
+        # token, which must not be served to anybody else.
+        renderer = getattr(request, 'accepted_renderer', None)
+        if not timeout or get_requested_expansions(request) or \
+                not isinstance(renderer, JSONRenderer):
+            return super(ResponseCacheMixin, self).get(
+                request, *args, **kwargs)
+
+        cache = get_shared_cache()
+        cache_key = self.get_response_cache_key(request)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            content, headers = cached
+            response = HttpResponse(content)
+            for header, value in headers:
+                response[header] = value
+            return response
+
+        response = super(ResponseCacheMixin, self).get(
+            request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming:
+            return response
+
+        def cache_response(response):
+            cache.set(cache_key, (response.content, list(response.items())),
+                      timeout)
+
+        # rest framework responses are rendered after the view returns.
+        if getattr(response, 'is_rendered', True):
+            cache_response(response)
+        else:
+            response.add_post_render_callback(cache_response)
+        return response
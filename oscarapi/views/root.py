@@ -14,6 +14,8 @@ def PUBLIC_APIS(r, f):
         ('basket', reverse('api-basket', request=r, format=f)),
         ('basket-add-product', reverse('api-basket-add-product', request=r,
                                        format=f)),
+        ('basket-add-products', reverse('api-basket-add-products', request=r,
+                                        format=f)),
         ('basket-add-voucher', reverse('api-basket-add-voucher', request=r,
                                        format=f)),
         ('basket-shipping-methods', reverse('api-basket-shipping-methods', request=r,
@@ -4,6 +4,7 @@ from rest_framework import generics, exceptions
 from rest_framework.relations import HyperlinkedRelatedField
 
 from oscarapi import permissions
+from oscarapi.basket.operations import get_request_basket
 
 
 __all__ = ('BasketPermissionMixin',)
@@ -37,6 +38,10 @@ class BasketPermissionMixin(object):
     def check_basket_permission(self, request, basket_pk=None, basket=None):
         "Check if the user may access this basket"
         if basket is None:
-            basket = generics.get_object_or_404(Basket.objects, pk=basket_pk)
+            # avoid a query when it is the basket of this request.
+            basket = get_request_basket(request)
+            if basket is None or str(basket.pk) != str(basket_pk):
+                basket = generics.get_object_or_404(
+                    Basket.objects, pk=basket_pk)
         self.check_object_permissions(request, basket)
         return basket